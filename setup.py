@@ -74,6 +74,7 @@ setuptools.setup(
     ],
     extras_require={
         'sorted_measurements_dict': ['measurements[sorted_measurements_dict]'],
+        'inotify': ['inotify_simple'],
     },
 
     # scripts
@@ -83,6 +84,8 @@ setuptools.setup(
             'simulation_model_save = simulation.model.save:_main',
             'simulation_model_remove = simulation.model.remove:_main',
             'simulation_model_update_job_options = simulation.model.update_job_options:_main',
+            'simulation_model_consolidate_trajectories = simulation.model.consolidate_trajectories:_main',
+            'simulation_model_index_vector_concentrations = simulation.model.index_vector_concentrations:_main',
             'simulation_optimization_save = simulation.optimization.save:_main',
             'simulation_optimization_save_all = simulation.optimization.save_all:_main',
             'simulation_optimization_matlab_cost_function_eval = simulation.optimization.matlab.cost_function:_main',
@@ -0,0 +1,112 @@
+import os
+import re
+
+import numpy as np
+
+import simulation.model.constants
+import simulation.model.data
+
+import util.io.fs
+import util.logging
+import util.petsc.universal
+
+
+# *** annual states *** #
+
+def annual_state_years(path, tracer):
+    regular_expression = re.escape(simulation.model.constants.METOS_ANNUAL_STATE_FILENAME.format(year=0, tracer=tracer)).replace('0000', r'(\d{4})', 1)
+    years = []
+    for filename in os.listdir(path):
+        match = re.fullmatch(regular_expression, filename)
+        if match is not None:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def annual_state_files(path, tracer, years):
+    return [os.path.join(path, simulation.model.constants.METOS_ANNUAL_STATE_FILENAME.format(year=year, tracer=tracer)) for year in years]
+
+
+def load_annual_states(path, tracers, number_of_states=None):
+    # returns array with the last annual states, each row contains the states of all tracers concatenated
+    years = annual_state_years(path, tracers[0])
+    if number_of_states is not None:
+        years = years[-number_of_states:]
+    states = np.empty((len(years), len(tracers) * simulation.model.constants.METOS_VECTOR_LEN))
+    for i, tracer in enumerate(tracers):
+        tracer_slice = slice(i * simulation.model.constants.METOS_VECTOR_LEN, (i + 1) * simulation.model.constants.METOS_VECTOR_LEN)
+        for j, file in enumerate(annual_state_files(path, tracer, years)):
+            states[j, tracer_slice] = simulation.model.data.load_petsc_vec_to_memmap(file)
+    return states
+
+
+def remove_annual_states(path, tracers):
+    for tracer in tracers:
+        for file in annual_state_files(path, tracer, annual_state_years(path, tracer)):
+            util.io.fs.remove_file(file, force=True, not_exist_okay=True)
+
+
+# *** extrapolation *** #
+
+def anderson_extrapolation(states):
+    # states x_0, ..., x_m are consecutive iterates of a fixed point iteration x_{k+1} = G(x_k)
+    # the residuals f_k = x_{k+1} - x_k are combined with coefficients summing to one to minimal norm and the same combination is applied to G(x_k)
+    states = np.asarray(states)
+    residuals = states[1:] - states[:-1]
+    gamma = np.linalg.lstsq(np.diff(residuals, axis=0).T, residuals[-1], rcond=None)[0]
+    coefficients = np.zeros(len(residuals))
+    coefficients[-1] = 1
+    coefficients[1:] -= gamma
+    coefficients[:-1] += gamma
+    return coefficients @ states[1:], coefficients
+
+
+def minimal_polynomial_extrapolation(states):
+    # states x_0, ..., x_m are consecutive iterates of a fixed point iteration x_{k+1} = G(x_k)
+    # the coefficients c with c_m = 1 of the minimal polynomial are determined by least squares for the differences u_k = x_{k+1} - x_k
+    states = np.asarray(states)
+    differences = states[1:] - states[:-1]
+    c = np.linalg.lstsq(differences[:-1].T, - differences[-1], rcond=None)[0]
+    c = np.append(c, 1)
+    coefficients = c / c.sum()
+    return coefficients @ states[:-1], coefficients
+
+
+EXTRAPOLATION_METHODS = {'anderson': anderson_extrapolation, 'mpe': minimal_polynomial_extrapolation}
+
+
+def remove_negative_values_keeping_mass(concentrations, volumes):
+    # concentrations with shape (number of tracers, METOS_VECTOR_LEN) and volumes of the boxes in metos vector order
+    total_mass = np.sum(concentrations * volumes)
+    concentrations = np.maximum(concentrations, 0)
+    concentrations *= total_mass / np.sum(concentrations * volumes)
+    return concentrations
+
+
+def extrapolate(path, tracers, method, volumes, number_of_states=None, output_filename=None):
+    # extrapolates annual states in path and saves the result, returns the saved files or None if extrapolation is not reliable
+    if number_of_states is None:
+        number_of_states = simulation.model.constants.MODEL_SPINUP_ACCELERATION_NUMBER_OF_STATES
+    if output_filename is None:
+        output_filename = simulation.model.constants.MODEL_SPINUP_ACCELERATION_FILENAME
+
+    states = load_annual_states(path, tracers, number_of_states=number_of_states)
+    if len(states) < 3:
+        util.logging.debug(f'Only {len(states)} annual states are available in {path}. No extrapolation is possible.')
+        return None
+
+    extrapolated_state, coefficients = EXTRAPOLATION_METHODS[method](states)
+    max_coefficient = simulation.model.constants.MODEL_SPINUP_ACCELERATION_MAX_COEFFICIENT
+    if not np.all(np.isfinite(extrapolated_state)) or np.abs(coefficients).max() > max_coefficient:
+        util.logging.debug(f'Extrapolation with {method} in {path} is not reliable with coefficients {coefficients}.')
+        return None
+
+    concentrations = extrapolated_state.reshape(len(tracers), simulation.model.constants.METOS_VECTOR_LEN)
+    concentrations = remove_negative_values_keeping_mass(concentrations, volumes)
+    files = [os.path.join(path, output_filename.format(tracer=tracer)) for tracer in tracers]
+    for file, concentration in zip(files, concentrations):
+        util.io.fs.remove_file(file, force=True, not_exist_okay=True)
+        util.petsc.universal.save_numpy_array_to_petsc_vec(file, concentration)
+        util.io.fs.make_read_only(file)
+    util.logging.debug(f'Extrapolated {len(states)} annual states in {path} with {method} and coefficients {coefficients}.')
+    return files
@@ -34,7 +34,12 @@ class Cache:
             if derivative_used:
                 if derivative_accuracy_order is None:
                     derivative_accuracy_order = self.model.model_options.derivative_options.accuracy_order
-                derivative_dirname = simulation.model.constants.DATABASE_CACHE_DERIVATIVE_DIRNAME.format(derivative_step_size=self.model.model_options.derivative_options.step_size, derivative_years=self.model.model_options.derivative_options.years, derivative_accuracy_order=derivative_accuracy_order)
+                derivative_options = self.model.model_options.derivative_options
+                derivative_adaptive_tolerance = self.model.derivative_adaptive_tolerance
+                if derivative_adaptive_tolerance is None:
+                    derivative_dirname = simulation.model.constants.DATABASE_CACHE_DERIVATIVE_DIRNAME.format(derivative_step_size=derivative_options.step_size, derivative_years=derivative_options.years, derivative_accuracy_order=derivative_accuracy_order)
+                else:
+                    derivative_dirname = simulation.model.constants.DATABASE_CACHE_DERIVATIVE_ADAPTIVE_DIRNAME.format(derivative_step_size=derivative_options.step_size, derivative_years=derivative_options.years, derivative_adaptive_tolerance=derivative_adaptive_tolerance, derivative_accuracy_order=derivative_accuracy_order)
                 bottom_dirs = os.path.join(bottom_dirs, derivative_dirname)
 
             file = os.path.join(model.parameter_set_dir, self.cache_dirname, bottom_dirs, filename)
@@ -149,9 +154,53 @@ class Model_With_F_File_and_MemoryCached(simulation.model.eval.Model_With_F_Memo
         return result
 
     def f_all(self, time_dim, tracers=None, return_as_dict=True):
-        calculate_function_for_boxes = super().f_all
+        return self.f_all_for_time_dims((time_dim,), tracers=tracers, return_as_dict=return_as_dict)[time_dim]
+
+    def f_all_for_time_dims(self, time_dims, tracers=None, return_as_dict=True):
+        tracers = self.check_tracers(tracers)
+        time_dims = tuple(time_dims)
         file_pattern = os.path.join(simulation.model.constants.DATABASE_POINTS_OUTPUT_DIRNAME, simulation.model.constants.DATABASE_F_FILENAME)
-        return self._cached_values_for_boxes(time_dim, calculate_function_for_boxes, file_pattern, derivative_used=False, tracers=tracers, return_as_dict=return_as_dict)
+
+        def get_file(time_dim, tracer):
+            data_set_name = simulation.model.constants.DATABASE_ALL_DATASET_NAME.format(time_dim=time_dim)
+            return self._cache.get_file(file_pattern, derivative_used=False, tracer=tracer, data_set_name=data_set_name)
+
+        # load cached values from cache
+        results_dict = {time_dim: {} for time_dim in time_dims}
+        not_cached_tracers = set()
+        for time_dim in time_dims:
+            for tracer in tracers:
+                file = get_file(time_dim, tracer)
+                if self._cache.has_value(file):
+                    results_dict[time_dim][tracer] = self._cache.load_value(file)
+                else:
+                    not_cached_tracers.add(tracer)
+        not_cached_tracers = sorted(not_cached_tracers)
+
+        # calculate not cached values, also for coarser time dims which are not cached and can be aggregated from the same trajectory
+        if len(not_cached_tracers) > 0:
+            time_steps_per_year = self.model_options.time_steps_per_year
+            additional_time_dims = tuple(time_dim for time_dim in simulation.model.constants.DATABASE_ALL_CACHED_TIME_DIMS
+                                         if time_dim not in time_dims and time_dim < max(time_dims) and time_steps_per_year % time_dim == 0
+                                         and any(not self._cache.has_value(get_file(time_dim, tracer)) for tracer in not_cached_tracers))
+            calculated_results_dict = super().f_all_for_time_dims(time_dims + additional_time_dims, tracers=not_cached_tracers)
+
+            # save calculated values and store in result
+            for time_dim, time_dim_calculated_results_dict in calculated_results_dict.items():
+                for tracer, tracer_values in time_dim_calculated_results_dict.items():
+                    file = get_file(time_dim, tracer)
+                    if not self._cache.has_value(file):
+                        self._cache.save_value(file, tracer_values)
+                    if time_dim in results_dict and tracer not in results_dict[time_dim]:
+                        results_dict[time_dim][tracer] = tracer_values
+        assert all(len(results_dict[time_dim]) == len(tracers) for time_dim in time_dims)
+
+        # convert to array if needed
+        if not return_as_dict:
+            results_dict = {time_dim: np.array([results_dict[time_dim][tracer] for tracer in tracers]) for time_dim in time_dims}
+
+        # return
+        return results_dict
 
     def _cached_values_for_points(self, points, calculate_function_for_points, file_pattern, derivative_used, derivative_accuracy_order=None):
         # load cached values and separate not cached points
@@ -172,6 +221,20 @@ class Model_With_F_File_and_MemoryCached(simulation.model.eval.Model_With_F_Memo
                         not_cached_points_dict[tracer] = {}
                     not_cached_points_dict[tracer][data_set_name] = data_set_points
 
+        # interpolate not cached values from cached values of all boxes if available
+        if len(not_cached_points_dict) > 0 and self._is_interpolation_operator_supported():
+            all_data_set_name = simulation.model.constants.DATABASE_ALL_DATASET_NAME.format(time_dim=self.model_options.time_steps_per_year)
+            for tracer in tuple(not_cached_points_dict.keys()):
+                all_file = self._cache.get_file(file_pattern, derivative_used=derivative_used, derivative_accuracy_order=derivative_accuracy_order, tracer=tracer, data_set_name=all_data_set_name)
+                if self._cache.has_value(all_file):
+                    util.logging.debug(f'Interpolating values for tracer {tracer} from values of all boxes in {all_file}.')
+                    all_values = self._cache.load_value(all_file, use_memmap=True)
+                    for data_set_name, data_set_points in not_cached_points_dict.pop(tracer).items():
+                        data_set_results = self._interpolate_all_values(all_values, data_set_points)
+                        file = self._cache.get_file(file_pattern, derivative_used=derivative_used, derivative_accuracy_order=derivative_accuracy_order, tracer=tracer, data_set_name=data_set_name)
+                        self._cache.save_value(file, data_set_results)
+                        results_dict[tracer][data_set_name] = data_set_results
+
         # interpolate not cached values
         if len(not_cached_points_dict) > 0:
             calculated_results_dict = calculate_function_for_points(not_cached_points_dict)
@@ -246,6 +309,12 @@ class Model_With_F_File_and_MemoryCached(simulation.model.eval.Model_With_F_Memo
         util.logging.debug(f'Calculating f values for measurements {tuple(map(str, measurements_list))}.')
         return self._cached_values_for_measurements(self.f_points, *measurements_list)
 
+    async def af_all(self, model_options, time_dim, tracers=None, return_as_dict=True):
+        return await self._call_async(model_options, 'f_all', time_dim, tracers=tracers, return_as_dict=return_as_dict)
+
+    async def af_measurements(self, model_options, *measurements_list):
+        return await self._call_async(model_options, 'f_measurements', *measurements_list)
+
 
 class Model_With_F_And_DF_File_and_MemoryCached(Model_With_F_File_and_MemoryCached, simulation.model.eval.Model_With_F_And_DF_MemoryCached):
 
@@ -273,5 +342,111 @@ class Model_With_F_And_DF_File_and_MemoryCached(Model_With_F_File_and_MemoryCach
 
         return self._cached_values_for_measurements(calculate_function_for_points, *measurements_list)
 
+    def df_all_for_orders(self, time_dim, orders, tracers=None, include_total_concentration=True, return_as_dict=True):
+        # returns dict with df values for each (derivative_order, accuracy_order) pair in orders
+        # not cached values of all orders are calculated together, so that shared partial derivative runs are only started once
+        orders = self._derivative_orders(orders)
+        super_df_all = super().df_all
+        super_df_all_for_orders = super().df_all_for_orders
+        calculated_df_dict = {}
+
+        def calculate_function_for_all_for_order(derivative_order, accuracy_order):
+            def calculate_function_for_all(time_dim, tracers):
+                if len(tracers) == 0:
+                    return {}
+                if (derivative_order, accuracy_order) not in calculated_df_dict:
+                    not_calculated_orders = [order for order in orders if order not in calculated_df_dict]
+                    calculated_df_dict.update(super_df_all_for_orders(time_dim, not_calculated_orders, tracers=tracers, include_total_concentration=include_total_concentration))
+                df = calculated_df_dict[(derivative_order, accuracy_order)]
+                if all(tracer in df for tracer in tracers):
+                    return {tracer: df[tracer] for tracer in tracers}
+                else:
+                    return super_df_all(time_dim, tracers=tracers, include_total_concentration=include_total_concentration, derivative_order=derivative_order, accuracy_order=accuracy_order)
+            return calculate_function_for_all
+
+        df_dict = {}
+        for derivative_order, accuracy_order in orders:
+            file_pattern = os.path.join(simulation.model.constants.DATABASE_POINTS_OUTPUT_DIRNAME, simulation.model.constants.DATABASE_DF_FILENAME.format(include_total_concentration=include_total_concentration, derivative_order=derivative_order))
+            df_dict[(derivative_order, accuracy_order)] = self._cached_values_for_boxes(time_dim, calculate_function_for_all_for_order(derivative_order, accuracy_order), file_pattern, derivative_used=True, derivative_accuracy_order=accuracy_order, tracers=tracers, return_as_dict=return_as_dict)
+        return df_dict
+
+    def df_points_for_orders(self, points, orders, include_total_concentration=True):
+        orders = self._derivative_orders(orders)
+        super_df_points = super().df_points
+        super_df_points_for_orders = super().df_points_for_orders
+        calculated_df_dict = {}
+
+        def calculate_function_for_points_for_order(derivative_order, accuracy_order):
+            def calculate_function_for_points(points):
+                if (derivative_order, accuracy_order) not in calculated_df_dict:
+                    not_calculated_orders = [order for order in orders if order not in calculated_df_dict]
+                    calculated_df_dict.update(super_df_points_for_orders(points, not_calculated_orders, include_total_concentration=include_total_concentration))
+                df = calculated_df_dict[(derivative_order, accuracy_order)]
+                if all(tracer in df and data_set_name in df[tracer] for tracer, tracer_points_dict in points.items() for data_set_name in tracer_points_dict):
+                    return {tracer: {data_set_name: df[tracer][data_set_name] for data_set_name in tracer_points_dict} for tracer, tracer_points_dict in points.items()}
+                else:
+                    return super_df_points(points, include_total_concentration=include_total_concentration, derivative_order=derivative_order, accuracy_order=accuracy_order)
+            return calculate_function_for_points
+
+        df_dict = {}
+        for derivative_order, accuracy_order in orders:
+            file_pattern = os.path.join(simulation.model.constants.DATABASE_POINTS_OUTPUT_DIRNAME, simulation.model.constants.DATABASE_DF_FILENAME.format(include_total_concentration=include_total_concentration, derivative_order=derivative_order))
+            df_dict[(derivative_order, accuracy_order)] = self._cached_values_for_points(points, calculate_function_for_points_for_order(derivative_order, accuracy_order), file_pattern, derivative_used=True, derivative_accuracy_order=accuracy_order)
+        return df_dict
+
+    def df_measurements_for_orders(self, *measurements_list, orders, include_total_concentration=True):
+        orders = self._derivative_orders(orders)
+        calculated_df_dict = {}
+
+        def calculate_function_for_points_for_order(order):
+            def calculate_function_for_points(points):
+                if len(calculated_df_dict) == 0:
+                    calculated_df_dict.update(self.df_points_for_orders(points, orders, include_total_concentration=include_total_concentration))
+                return calculated_df_dict[order]
+            return calculate_function_for_points
+
+        return {order: self._cached_values_for_measurements(calculate_function_for_points_for_order(order), *measurements_list) for order in orders}
+
+    def dfu_all(self, direction, time_dim, tracers=None, include_total_concentration=True, accuracy_order=None, return_as_dict=True):
+        # values are cached for the normalized direction which determines the file name
+        super_dfu_all = super().dfu_all
+
+        def calculate_function_for_all(time_dim, tracers):
+            return super_dfu_all(direction, time_dim, tracers=tracers, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+
+        file_pattern = os.path.join(simulation.model.constants.DATABASE_POINTS_OUTPUT_DIRNAME, simulation.model.constants.DATABASE_DFU_FILENAME.format(include_total_concentration=include_total_concentration, direction_hash=self.direction_hash(direction)))
+        return self._cached_values_for_boxes(time_dim, calculate_function_for_all, file_pattern, derivative_used=True, derivative_accuracy_order=accuracy_order, tracers=tracers, return_as_dict=return_as_dict)
+
+    def dfu_points(self, direction, points, include_total_concentration=True, accuracy_order=None):
+        super_dfu_points = super().dfu_points
+
+        def calculate_function_for_points(points):
+            return super_dfu_points(direction, points, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+
+        file_pattern = os.path.join(simulation.model.constants.DATABASE_POINTS_OUTPUT_DIRNAME, simulation.model.constants.DATABASE_DFU_FILENAME.format(include_total_concentration=include_total_concentration, direction_hash=self.direction_hash(direction)))
+        return self._cached_values_for_points(points, calculate_function_for_points, file_pattern, derivative_used=True, derivative_accuracy_order=accuracy_order)
+
+    def dfu_measurements(self, direction, *measurements_list, include_total_concentration=True, accuracy_order=None):
+        def calculate_function_for_points(points):
+            return self.dfu_points(direction, points, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+
+        return self._cached_values_for_measurements(calculate_function_for_points, *measurements_list)
+
+    def dfv_all(self, direction, time_dim, tracers=None, include_total_concentration=True, accuracy_order=None, return_as_dict=True):
+        dfu = self.dfu_all(direction, time_dim, tracers=tracers, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order, return_as_dict=return_as_dict)
+        return self._scale_values(dfu, np.linalg.norm(direction))
+
+    def dfv_points(self, direction, points, include_total_concentration=True, accuracy_order=None):
+        return super().dfv_points(direction, points, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+
+    def dfv_measurements(self, direction, *measurements_list, include_total_concentration=True, accuracy_order=None):
+        return super().dfv_measurements(direction, *measurements_list, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+
+    async def adf_all(self, model_options, time_dim, tracers=None, include_total_concentration=True, derivative_order=1, accuracy_order=None, return_as_dict=True):
+        return await self._call_async(model_options, 'df_all', time_dim, tracers=tracers, include_total_concentration=include_total_concentration, derivative_order=derivative_order, accuracy_order=accuracy_order, return_as_dict=return_as_dict)
+
+    async def adf_measurements(self, model_options, *measurements_list, include_total_concentration=True, derivative_order=1, accuracy_order=None):
+        return await self._call_async(model_options, 'df_measurements', *measurements_list, include_total_concentration=include_total_concentration, derivative_order=derivative_order, accuracy_order=accuracy_order)
+
 
 Model = Model_With_F_And_DF_File_and_MemoryCached
@@ -0,0 +1,52 @@
+import os
+
+import simulation
+import simulation.model.data
+
+import util.logging
+
+
+def trajectory_dirs(path):
+    for dir, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        if len(simulation.model.data.trajectory_tracers(dir)) > 0:
+            yield dir
+
+
+def consolidate(path, recursive=False, remove_petsc_files=True):
+    if recursive:
+        dirs = trajectory_dirs(path)
+    else:
+        dirs = (path,)
+
+    for dir in dirs:
+        tracers = simulation.model.data.trajectory_tracers(dir)
+        util.logging.info(f'Consolidating trajectories for tracers {tracers} in {dir}.')
+        simulation.model.data.consolidate_trajectory(dir, tracers=tracers, remove_petsc_files=remove_petsc_files)
+
+
+# *** main function for script call *** #
+
+def _main():
+
+    # parse arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Consolidating trajectories stored as PETSc vectors to one array file per tracer.')
+
+    parser.add_argument('paths', nargs='+', help='The directories containing the trajectories.')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Consolidate also all trajectories in subdirectories.')
+    parser.add_argument('--keep_petsc_files', action='store_true', help='Do not remove the PETSc vectors after consolidation.')
+    parser.add_argument('-d', '--debug_level', choices=util.logging.LEVELS, default='INFO', help='Print debug infos low to passed level.')
+    parser.add_argument('--version', action='version', version='%(prog)s {}'.format(simulation.__version__))
+
+    args = parser.parse_args()
+
+    # call function
+    with util.logging.Logger(level=args.debug_level):
+        for path in args.paths:
+            consolidate(path, recursive=args.recursive, remove_petsc_files=not args.keep_petsc_files)
+
+
+if __name__ == "__main__":
+    _main()
@@ -33,8 +33,16 @@ METOS_Z_LEFT = METOS_LSM.z_left
 METOS_Z_CENTER = METOS_LSM.z_center
 METOS_VECTOR_LEN = 52749
 
+PETSC_VEC_HEADER = 1211214
+
 
 METOS_TRAJECTORY_FILENAME = 'sp0000-ts{time_step:0>4d}-{tracer}_output.petsc'
+METOS_TRAJECTORY_LOAD_MAX_WORKERS = 8
+METOS_TRAJECTORY_LOAD_PREFETCH = 32
+METOS_TRAJECTORY_LOAD_USE_MEMMAP = True
+METOS_TRAJECTORY_CONSOLIDATED_FILENAME = '{tracer}_trajectory.npy'
+METOS_TRAJECTORY_CONSOLIDATE = True
+METOS_ANNUAL_STATE_FILENAME = 'sp{year:0>4d}-{tracer}_output.petsc'
 
 # METOS 3D N-DOP
 METOS_TRAJECTORY_FILENAMES = ('sp0000-ts{:0>4}-dop_output.petsc', 'sp0000-ts{:0>4}-po4_output.petsc')
@@ -44,11 +52,31 @@ METOS_TRACER_DIM = len(METOS_TRAJECTORY_FILENAMES)
 # job
 JOB_OPTIONS_FILENAME = 'job_options.hdf5'
 JOB_MEMORY_GB = 4
+JOB_OUTPUT_COMPLETE_TIMEOUT_SECONDS = 30
+JOB_CONVERGENCE_HISTORY_FILENAME = 'convergence_history.npy'
+JOB_MONITOR_USE = True
+JOB_MONITOR_USE_INOTIFY = True
+JOB_MONITOR_PAUSE_SECONDS_MIN = 2
+JOB_MONITOR_PAUSE_SECONDS_MAX = 60
+JOB_MONITOR_PAUSE_SECONDS_FACTOR = 1.5
+JOB_MONITOR_FULL_CHECK_SECONDS = 600
+JOB_MONITOR_MAX_WORKERS = 8
 
 
 # model spinup
 MODEL_SPINUP_MAX_YEARS = 50000
 MODEL_START_FROM_CLOSEST_PARAMETER_SET = False
+MODEL_WARM_START_FROM_NEAREST_PARAMETER_SETS = False
+MODEL_WARM_START_NUMBER_OF_PARAMETER_SETS = 4
+MODEL_WARM_START_MAX_DISTANCE = 0.1  # euclidean distance of parameters scaled by their typical values
+MODEL_WARM_START_WEIGHTS = 'inverse_distance'  # 'inverse_distance' or 'local_linear'
+MODEL_WARM_START_INVERSE_DISTANCE_POWER = 2
+MODEL_WARM_START_MIN_YEARS = 100
+MODEL_SPINUP_ACCELERATION = None  # None, 'anderson' or 'mpe'
+MODEL_SPINUP_ACCELERATION_YEARS = 50
+MODEL_SPINUP_ACCELERATION_NUMBER_OF_STATES = 10
+MODEL_SPINUP_ACCELERATION_MAX_COEFFICIENT = 100
+MODEL_SPINUP_ACCELERATION_FILENAME = '{tracer}_extrapolated.petsc'
 MODEL_DEFAULT_SPINUP_OPTIONS = {'years': 10000, 'tolerance': 0.0, 'combination': 'or', 'match_type': 'best'}
 MODEL_DEFAULT_DERIVATIVE_STEP_SIZE = 10**-5
 if MODEL_DEFAULT_DERIVATIVE_STEP_SIZE <= 10**-7:
@@ -68,6 +96,13 @@ elif MODEL_DEFAULT_DERIVATIVE_STEP_SIZE <= 10**-1:
 else:
     MODEL_DEFAULT_DERIVATIVE_YEARS = 10000
 MODEL_DEFAULT_DERIVATIVE_OPTIONS = {'years': MODEL_DEFAULT_DERIVATIVE_YEARS, 'step_size': MODEL_DEFAULT_DERIVATIVE_STEP_SIZE, 'accuracy_order': 2}
+MODEL_DERIVATIVE_MAX_PARALLEL_RUN_PROCESSING = 8
+MODEL_DERIVATIVE_MAX_PARALLEL_RUN_PROCESSING_MEMORY_GB = 4  # bound for values loaded at the same time by parallel run processing
+MODEL_DERIVATIVE_ADAPTIVE_TOLERANCE = None  # None or relative change of derivative between chunks
+MODEL_DERIVATIVE_ADAPTIVE_YEARS = 100
+# the reused spinup is not run the derivative years further as the disturbed parameters, so remaining spinup drift enters the difference quotients divided by the step size (squared for second derivatives)
+MODEL_DERIVATIVE_REUSE_SPINUP_FOR_UNDISTURBED_PARAMETERS = False
+MODEL_ASYNC_MAX_WORKERS = 32
 
 
 # model names
@@ -233,16 +268,26 @@ DATABASE_MODEL_DIRNAME = 'model_{}'
 DATABASE_TIME_STEP_DIRNAME = 'time_step_{:0>4d}'
 DATABASE_SPINUP_DIRNAME = 'spinup'
 DATABASE_DERIVATIVE_DIRNAME = os.path.join('derivative', 'spinup_years_{spinup_real_years:d}_-_derivative_step_size_{derivative_step_size:g}_-_derivative_spinup_years_{derivative_years:d}')
+DATABASE_DERIVATIVE_ADAPTIVE_DIRNAME = os.path.join('derivative', 'spinup_years_{spinup_real_years:d}_-_derivative_step_size_{derivative_step_size:g}_-_adaptive_years_{adaptive_years:d}_-_derivative_spinup_years_{derivative_years:d}')
 DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_INT = '{index:d}_{h_factor:+d}'
 DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_FLOAT_PRECISION = 3
 DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_FLOAT = '{index:d}_{h_factor:+' + str(DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_FLOAT_PRECISION) + 'f}'
 DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_SEPARATOR = '_-_'
 DATABASE_PARTIAL_DERIVATIVE_DIRNAME = 'partial_derivative' + DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_SEPARATOR + '{factor_ids}'
+DATABASE_DIRECTIONAL_DERIVATIVE_DIRNAME = 'directional_derivative' + DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_SEPARATOR + '{direction_hash}_{h_factor:+d}'
+DATABASE_DIRECTION_FILENAME = 'direction.txt'
+DATABASE_DIRECTION_HASH_DECIMALS = 12
+DATABASE_DIRECTION_HASH_LENGTH = 16
 DATABASE_RUN_DIRNAME = 'run_{:0>5d}'
+DATABASE_SPINUP_SUMMARY_FILENAME = 'runs_summary.json'
+DATABASE_WARM_START_DIRNAME = 'warm_start'
+DATABASE_WARM_START_INFO_FILENAME = 'warm_start.json'
 
 DATABASE_VECTOR_CONCENTRATIONS_DIRNAME = 'initial_concentration_vector'
 DATABASE_VECTOR_CONCENTRATIONS_FILENAME = 'concentration_{tracer}.petsc'
 DATABASE_VECTOR_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES = np.finfo(np.float64).precision
+DATABASE_VECTOR_CONCENTRATIONS_FINGERPRINT_FILENAME = 'fingerprint.json'
+DATABASE_VECTOR_CONCENTRATIONS_FINGERPRINT_ROUNDING_ERROR = 10**-12
 
 DATABASE_CONSTANT_CONCENTRATIONS_DIRNAME = 'initial_concentration_constant'
 DATABASE_CONSTANT_CONCENTRATIONS_LOOKUP_ARRAY_FILENAME = 'concentrations_database.npy'
@@ -258,24 +303,45 @@ DATABASE_PARAMETERS_RELIABLE_DECIMAL_PLACES = np.finfo(np.float64).precision
 assert DATABASE_PARAMETERS_RELIABLE_DECIMAL_PLACES == 15
 DATABASE_PARAMETERS_FORMAT_STRING = '{:.' + '{}'.format(DATABASE_PARAMETERS_RELIABLE_DECIMAL_PLACES) + 'f}'
 
+DATABASE_SPATIAL_INDEX_REBUILD_MIN = 16
+
 
 DATABASE_CACHE_SPINUP_DIRNAME = 'spinup_years_{spinup_years:d}'
 DATABASE_CACHE_DERIVATIVE_DIRNAME = 'derivative_-_step_size_{derivative_step_size:g}_-_spinup_years_{derivative_years:d}_-_accuracy_order_{derivative_accuracy_order}'
+DATABASE_CACHE_DERIVATIVE_ADAPTIVE_DIRNAME = 'derivative_-_step_size_{derivative_step_size:g}_-_max_spinup_years_{derivative_years:d}_-_adaptive_tolerance_{derivative_adaptive_tolerance:g}_-_accuracy_order_{derivative_accuracy_order}'
 DATABASE_POINTS_OUTPUT_DIRNAME = os.path.join('output', DATABASE_CACHE_SPINUP_DIRNAME, '{tracer}_-_{data_set_name}')
 DATABASE_ALL_DATASET_NAME = 'all_model_values_-_time_dim_{time_dim}'
+DATABASE_ALL_CACHED_TIME_DIMS = (12, 4, 1)
 DATABASE_F_FILENAME = 'f.npz'
 DATABASE_DF_FILENAME = 'df_-_include_total_concentration_{include_total_concentration}_-_derivative_order_{derivative_order}.npz'
+DATABASE_DFU_FILENAME = 'dfu_-_include_total_concentration_{include_total_concentration}_-_direction_{direction_hash}.npz'
 DATABASE_CACHE_OPTION_FILE_SUFFIX = '_options'
 
 DATABASE_TMP_DIR = os.path.join(util.constants.TMP_DIR, 'metos3d_simulations')
+DATABASE_TRAJECTORY_CACHE_USE = False  # if True, trajectories of all tracers are kept on disk in DATABASE_TRAJECTORY_CACHE_DIR up to DATABASE_TRAJECTORY_CACHE_MAX_SIZE_GB
+DATABASE_TRAJECTORY_CACHE_DIR = os.path.join(DATABASE_TMP_DIR, 'trajectory_cache')
+DATABASE_TRAJECTORY_CACHE_MAX_SIZE_GB = 100
 
 
 # model interpolator
-MODEL_INTERPOLATOR_FILE = os.path.join(DATABASE_OUTPUT_DIR, 'interpolator.ppy')
+MODEL_INTERPOLATOR_ENGINE = 'scattered'  # 'scattered' or 'grid'
+MODEL_INTERPOLATOR_CACHE_DIR = os.path.join(DATABASE_OUTPUT_DIR, 'interpolators')
+MODEL_INTERPOLATOR_CACHE_FILENAME = 'interpolator_-_{key}.pickle'
+MODEL_INTERPOLATOR_CACHE_MEMORY_MAXSIZE = 8
 MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND = (1 / METOS_T_DIM, 1 / METOS_X_DIM, 0, 0)
 MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR = 0
 MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR = 0
 
+# model interpolation operator
+MODEL_INTERPOLATION_OPERATOR_USE = True
+MODEL_INTERPOLATION_OPERATOR_DIR = os.path.join(DATABASE_OUTPUT_DIR, 'interpolation_operators')
+MODEL_INTERPOLATION_OPERATOR_FILENAME = 'interpolation_operator_-_{key}.npz'
+
+# model trajectory sparse loading for interpolation
+MODEL_TRAJECTORY_SPARSE_LOADING = True
+MODEL_TRAJECTORY_SPARSE_LOADING_TIME_MARGIN = 1
+MODEL_TRAJECTORY_SPARSE_LOADING_NUMBER_OF_BOXES = 8
+
 
 # node setups
 
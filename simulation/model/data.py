@@ -1,76 +1,189 @@
+import collections
+import concurrent.futures
+import glob
+import mmap
 import os
 
 import numpy as np
 
 import simulation.model.constants
 
+import util.io.fs
 import util.petsc.universal
+import util.cache.memory
 import util.logging
 
 
 # convert Metos vector to 3D vector
 
+@util.cache.memory.decorator()
+def metos_index_map():
+    METOS_LSM = simulation.model.constants.METOS_LSM
+
+    # get number of water boxes for each water column in metos order (y outer, x inner)
+    lsm = np.asarray(METOS_LSM.lsm, dtype=np.int64)
+    column_lengths = lsm.transpose().reshape(-1)
+    y_indices, x_indices = np.indices((METOS_LSM.y_dim, METOS_LSM.x_dim)).reshape(2, -1)
+
+    # repeat x and y indices for each box in its water column and calculate z indices
+    x_indices = np.repeat(x_indices, column_lengths)
+    y_indices = np.repeat(y_indices, column_lengths)
+    column_offsets = np.repeat(np.cumsum(column_lengths) - column_lengths, column_lengths)
+    z_indices = np.arange(len(x_indices)) - column_offsets
+
+    index_map = (x_indices, y_indices, z_indices)
+    assert all(len(indices) == simulation.model.constants.METOS_VECTOR_LEN for indices in index_map)
+    return index_map
+
+
+@util.cache.memory.decorator()
+def metos_inverse_index_map():
+    METOS_LSM = simulation.model.constants.METOS_LSM
+    inverse_index_map = np.full((METOS_LSM.x_dim, METOS_LSM.y_dim, METOS_LSM.z_dim), -1, dtype=np.int64)
+    inverse_index_map[metos_index_map()] = np.arange(simulation.model.constants.METOS_VECTOR_LEN)
+    return inverse_index_map
+
+
 def convert_metos_1D_to_3D(metos_vec):
-    assert len(metos_vec) == simulation.model.constants.METOS_VECTOR_LEN
+    metos_vec = np.asanyarray(metos_vec)
+    assert metos_vec.shape[-1] == simulation.model.constants.METOS_VECTOR_LEN
 
     METOS_LSM = simulation.model.constants.METOS_LSM
 
     # init array
-    array = np.empty([METOS_LSM.x_dim, METOS_LSM.y_dim, METOS_LSM.z_dim], dtype=np.float64)
+    array = np.empty(metos_vec.shape[:-1] + (METOS_LSM.x_dim, METOS_LSM.y_dim, METOS_LSM.z_dim), dtype=np.float64)
     array.fill(np.nan)
 
     # fill array
     util.logging.debug('Converting metos {} vector to {} matrix.'.format(metos_vec.shape, array.shape))
-
-    offset = 0
-    for iy in range(METOS_LSM.y_dim):
-        for ix in range(METOS_LSM.x_dim):
-            length = METOS_LSM[ix, iy]
-            if length > 0:
-                array[ix, iy, 0: length] = metos_vec[offset: offset + length]
-                offset = offset + length
+    array[(Ellipsis,) + metos_index_map()] = metos_vec
 
     return array
 
 
 def convert_3D_to_metos_1D(data):
-    assert data.ndim == 3
+    data = np.asanyarray(data)
+    assert data.ndim >= 3
 
-    metos_vec_len = np.sum(~np.isnan(data))
-    metos_vec = np.empty(metos_vec_len)
-    x_dim, y_dim, z_dim = data.shape
+    METOS_LSM = simulation.model.constants.METOS_LSM
 
-    offset = 0
-    for iy in range(y_dim):
-        for ix in range(x_dim):
-            data_x_y = data[ix, iy]
-            mask = ~ np.isnan(data_x_y)
-            length = sum(mask)
-            if length > 0:
-                metos_vec[offset: offset + length] = data_x_y[mask]
-                offset = offset + length
+    # gather water boxes of the metos land sea mask if exactly these are not nan
+    data_mask = ~ np.isnan(data)
+    if data.shape[-3:] == (METOS_LSM.x_dim, METOS_LSM.y_dim, METOS_LSM.z_dim):
+        index_map = metos_index_map()
+        water_mask = data_mask[(Ellipsis,) + index_map]
+        if water_mask.all() and np.count_nonzero(data_mask) == water_mask.size:
+            return data[(Ellipsis,) + index_map]
 
+    # otherwise gather all not nan values in metos order
+    assert data.ndim == 3
+    x_indices, y_indices, z_indices = np.where(data_mask)
+    order = np.lexsort((z_indices, x_indices, y_indices))
+    metos_vec = data[x_indices[order], y_indices[order], z_indices[order]]
     return metos_vec
 
 
+# load petsc vector
+
+def load_petsc_vec_to_memmap(file, will_need=False):
+    # read header
+    with open(file, mode='rb') as file_object:
+        header = np.fromfile(file_object, dtype='>i4', count=2)
+    if len(header) != 2 or header[0] != simulation.model.constants.PETSC_VEC_HEADER:
+        raise ValueError(f'File {file} is not a PETSc vector file.')
+    vec_len = int(header[1])
+
+    # map values (big-endian, byte swapping is done lazily by numpy if values are used)
+    util.logging.debug(f'Memory mapping petsc vector with length {vec_len} from {file}.')
+    vec = np.memmap(file, dtype='>f8', mode='r', offset=header.nbytes, shape=(vec_len,))
+
+    # advise os to read values ahead
+    if will_need:
+        try:
+            vec._mmap.madvise(mmap.MADV_WILLNEED)
+        except (AttributeError, OSError):
+            pass
+
+    return vec
+
+
 # load trajectory
 
-def load_trajectories_to_universal(path, tracers, convert_function=None, converted_result_shape=None, time_dim_desired=None, set_negative_values_to_zero=False):
-    util.logging.debug(f'Loading trajectories with tracers {tracers}, desired time dim {time_dim_desired}, set_negative_values_to_zero {set_negative_values_to_zero} and convert function {convert_function} with result shape {converted_result_shape} from {path}.')
+def _load_files_with_read_ahead(files, load_function, max_workers=None, prefetch=None):
+    if max_workers is None:
+        max_workers = simulation.model.constants.METOS_TRAJECTORY_LOAD_MAX_WORKERS
+    if prefetch is None:
+        prefetch = simulation.model.constants.METOS_TRAJECTORY_LOAD_PREFETCH
+    prefetch = max(prefetch, max_workers, 1)
 
-    # check input
-    if isinstance(tracers, str):
-        tracers = [tracers]
+    # load serial
+    if max_workers <= 1:
+        for file in files:
+            yield file, load_function(file)
+
+    # load concurrently with bounded read ahead and yield in passed order
+    else:
+        files = iter(files)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = collections.deque()
 
-    # check convert_function
-    if convert_function is None:
-        def convert_function(x):
-            return x
+            # read values in worker (memory mapped values would otherwise be paged in by the consumer)
+            def read_file(file):
+                return np.asarray(load_function(file), dtype=np.float64)
+
+            def submit_next_file():
+                file = next(files, None)
+                if file is not None:
+                    pending.append((file, executor.submit(read_file, file)))
+
+            try:
+                for _ in range(prefetch):
+                    submit_next_file()
+                while len(pending) > 0:
+                    file, future = pending.popleft()
+                    submit_next_file()
+                    yield file, future.result()
+            finally:
+                for file, future in pending:
+                    future.cancel()
+
+
+def _trajectory_file(path, tracer, time_step):
+    filename = simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracer, time_step=time_step)
+    return os.path.join(path, filename)
+
+
+def _consolidated_trajectory_file(path, tracer):
+    filename = simulation.model.constants.METOS_TRAJECTORY_CONSOLIDATED_FILENAME.format(tracer=tracer)
+    return os.path.join(path, filename)
 
-        if converted_result_shape is not None:
-            raise ValueError(f'The convert function is None but the converted result shape is not None ({converted_result_shape}).')
-    elif not callable(convert_function):
-        raise ValueError(f'The convert function {convert_function} has to be callable.')
+
+def is_trajectory_consolidated(path, tracer):
+    return os.path.exists(_consolidated_trajectory_file(path, tracer))
+
+
+def load_consolidated_trajectory(path, tracer):
+    file = _consolidated_trajectory_file(path, tracer)
+    util.logging.debug(f'Memory mapping consolidated trajectory from {file}.')
+    return np.load(file, mmap_mode='r')
+
+
+def trajectory_tracers(path):
+    tracers = set()
+    for filename_pattern in (simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer='*', time_step=0), simulation.model.constants.METOS_TRAJECTORY_CONSOLIDATED_FILENAME.format(tracer='*')):
+        prefix, suffix = filename_pattern.split('*')
+        for file in glob.iglob(os.path.join(glob.escape(path), filename_pattern)):
+            filename = os.path.basename(file)
+            tracers.add(filename[len(prefix):len(filename) - len(suffix)])
+    return sorted(tracers)
+
+
+def trajectory_time_dim(path, tracer):
+    # use consolidated trajectory if available
+    if is_trajectory_consolidated(path, tracer):
+        tracer_time_dim = load_consolidated_trajectory(path, tracer).shape[0]
+        util.logging.debug(f'Consolidated trajectory with {tracer_time_dim} time steps was found for tracer {tracer}.')
+        return int(tracer_time_dim)
 
     # calculate tracer_time_dim
     maximal_t_dim = simulation.model.constants.METOS_T_DIM
@@ -78,124 +191,355 @@ def load_trajectories_to_universal(path, tracers, convert_function=None, convert
     possible_time_dims = possible_time_dims.astype(np.min_scalar_type(maximal_t_dim))
 
     for tracer_time_dim in possible_time_dims:
-        filename = simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracers[0], time_step=tracer_time_dim - 1)
-        file = os.path.join(path, filename)
-        if os.path.exists(file):
+        if os.path.exists(_trajectory_file(path, tracer, tracer_time_dim - 1)):
             break
     else:
         raise FileNotFoundError(f'No PETSc vectors found in {path}.')
 
-    assert os.path.exists(os.path.join(path, simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracers[0], time_step=tracer_time_dim - 1)))
-    if os.path.exists(os.path.join(path, simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracers[0], time_step=tracer_time_dim))):
+    assert os.path.exists(_trajectory_file(path, tracer, tracer_time_dim - 1))
+    if os.path.exists(_trajectory_file(path, tracer, tracer_time_dim)):
         raise ValueError(f'Trajectory in {path} is incomplete.')
 
-    util.logging.debug(f'{tracer_time_dim} petsc vectors were found for each tracer.')
+    util.logging.debug(f'{tracer_time_dim} petsc vectors were found for tracer {tracer}.')
+    return int(tracer_time_dim)
+
 
-    # calculate time_step, check time_dim_desired
-    if time_dim_desired is not None:
-        time_step = tracer_time_dim / time_dim_desired
-        if time_step.is_integer():
-            time_step = int(time_step)
-        else:
-            raise ValueError(f'The desired time dimension {time_dim_desired} can not be satisfied because the tracer time dimension {tracer_time_dim} is not intiger divideable by {time_dim_desired}.')
+def _load_function(use_memmap=None):
+    if use_memmap is None:
+        use_memmap = simulation.model.constants.METOS_TRAJECTORY_LOAD_USE_MEMMAP
+    if use_memmap:
+        def load_function(file):
+            return load_petsc_vec_to_memmap(file, will_need=True)
     else:
-        time_dim_desired = tracer_time_dim
-        time_step = 1
+        load_function = util.petsc.universal.load_petsc_vec_to_numpy_array
+    return load_function
 
-    assert tracer_time_dim % time_dim_desired == 0
-    assert tracer_time_dim == time_dim_desired * time_step
 
-    # init trajectory
-    if converted_result_shape is None:
-        filename = simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracers[0], time_step=0)
-        file = os.path.join(path, filename)
-        trajectory = util.petsc.universal.load_petsc_vec_to_numpy_array(file)
-        converted_result_shape = convert_function(trajectory).shape
+def _iterate_trajectory_vectors(path, tracer, time_indices=None, max_workers=None, prefetch=None, use_memmap=None):
+    # yields (time index, metos vector) of the trajectory from consolidated trajectory or petsc files
+    if time_indices is None:
+        time_indices = range(trajectory_time_dim(path, tracer))
+
+    if is_trajectory_consolidated(path, tracer):
+        trajectory = load_consolidated_trajectory(path, tracer)
+        for time_index in time_indices:
+            yield time_index, trajectory[time_index]
 
-    tracers_len = len(tracers)
-    trajectory_shape = (tracers_len, time_dim_desired) + converted_result_shape
-    trajectory = np.zeros(trajectory_shape, dtype=np.float64)
+    else:
+        files = (_trajectory_file(path, tracer, time_index) for time_index in time_indices)
+        loaded_files = _load_files_with_read_ahead(files, _load_function(use_memmap=use_memmap), max_workers=max_workers, prefetch=prefetch)
+        try:
+            for time_index, (file, vec) in zip(time_indices, loaded_files):
+                assert file == _trajectory_file(path, tracer, time_index)
+                yield time_index, vec
+        finally:
+            loaded_files.close()
+
+
+def load_trajectory_time_range(path, tracer, start=0, stop=None):
+    # load only the metos vectors of the time steps in [start, stop)
+    if stop is None:
+        stop = trajectory_time_dim(path, tracer)
+    util.logging.debug(f'Loading trajectory for tracer {tracer} from {path} for time steps {start} to {stop}.')
+
+    if is_trajectory_consolidated(path, tracer):
+        trajectory = np.array(load_consolidated_trajectory(path, tracer)[start:stop], dtype=np.float64)
+    else:
+        trajectory = np.empty((stop - start, simulation.model.constants.METOS_VECTOR_LEN), dtype=np.float64)
+        for time_index, vec in _iterate_trajectory_vectors(path, tracer, time_indices=range(start, stop)):
+            trajectory[time_index - start] = vec
+    return trajectory
+
+
+def load_trajectory_values(path, tracer, time_indices, metos_indices):
+    # load only the values at the passed pairs of time indices and metos vector indices
+    time_indices = np.asarray(time_indices, dtype=np.int64)
+    metos_indices = np.asarray(metos_indices, dtype=np.int64)
+    assert time_indices.shape == metos_indices.shape and time_indices.ndim == 1
+    util.logging.debug(f'Loading {len(time_indices)} trajectory values for tracer {tracer} from {path}.')
+
+    # group pairs by time index
+    order = np.argsort(time_indices, kind='stable')
+    needed_time_indices, group_starts = np.unique(time_indices[order], return_index=True)
+    group_stops = np.append(group_starts[1:], len(order))
 
-    # load and calculate trajectory
-    util.logging.debug(f'Loading trajectories from {path} to array of size {trajectory.shape}.')
+    # read only needed time steps and needed entries
+    values = np.empty(len(time_indices), dtype=np.float64)
+    groups = zip(group_starts, group_stops)
+    for (time_index, vec), (group_start, group_stop) in zip(_iterate_trajectory_vectors(path, tracer, time_indices=needed_time_indices.tolist()), groups):
+        group = order[group_start:group_stop]
+        values[group] = vec[metos_indices[group]]
 
-    for tracers_index in range(tracers_len):
-        tracer = tracers[tracers_index]
+    if np.any(np.isnan(values)):
+        raise ValueError(f'Trajectory in {path} for tracer {tracer} contains nans.')
+    return values
+
+
+def consolidate_trajectory(path, tracers=None, remove_petsc_files=True):
+    if tracers is None:
+        tracers = trajectory_tracers(path)
+    elif isinstance(tracers, str):
+        tracers = [tracers]
+
+    for tracer in tracers:
+        consolidated_file = _consolidated_trajectory_file(path, tracer)
+        tracer_time_dim = trajectory_time_dim(path, tracer)
+
+        if not is_trajectory_consolidated(path, tracer):
+            util.logging.debug(f'Consolidating trajectory with {tracer_time_dim} time steps for tracer {tracer} to {consolidated_file}.')
+
+            # write time major array to temporary file and move it afterwards
+            consolidated_tmp_file = consolidated_file + '.tmp'
+            trajectory = np.lib.format.open_memmap(consolidated_tmp_file, mode='w+', dtype=np.float64, shape=(tracer_time_dim, simulation.model.constants.METOS_VECTOR_LEN))
+            try:
+                for time_index, vec in _iterate_trajectory_vectors(path, tracer, time_indices=range(tracer_time_dim)):
+                    trajectory[time_index] = vec
+                trajectory.flush()
+            except BaseException:
+                del trajectory
+                util.io.fs.remove_file(consolidated_tmp_file, force=True, not_exist_okay=True)
+                raise
+            else:
+                del trajectory
+                os.replace(consolidated_tmp_file, consolidated_file)
+
+        # remove petsc files
+        if remove_petsc_files:
+            for time_index in range(tracer_time_dim):
+                file = _trajectory_file(path, tracer, time_index)
+                util.io.fs.remove_file(file, force=True, not_exist_okay=True)
+                util.io.fs.remove_file(file + '.info', force=True, not_exist_okay=True)
+
+
+def _trajectory_time_step(tracer_time_dim, time_dim_desired):
+    if time_dim_desired is None:
+        return 1
+    time_step = tracer_time_dim / time_dim_desired
+    if time_step.is_integer():
+        return int(time_step)
+    else:
+        raise ValueError(f'The desired time dimension {time_dim_desired} can not be satisfied because the tracer time dimension {tracer_time_dim} is not intiger divideable by {time_dim_desired}.')
 
+
+def iterate_trajectories_to_universal(path, tracers, convert_function=None, time_dim_desired=None, set_negative_values_to_zero=False, max_workers=None, prefetch=None, use_memmap=None):
+    # yields (tracer_index, time_index, values) for each time averaged slice,
+    # values may be read only views which are only valid until the next slice is requested
+    util.logging.debug(f'Iterating trajectories with tracers {tracers}, desired time dim {time_dim_desired}, set_negative_values_to_zero {set_negative_values_to_zero} and convert function {convert_function} from {path} with max workers {max_workers}, prefetch {prefetch} and use_memmap {use_memmap}.')
+
+    # check input
+    if isinstance(tracers, str):
+        tracers = [tracers]
+    if convert_function is not None and not callable(convert_function):
+        raise ValueError(f'The convert function {convert_function} has to be callable.')
+
+    # calculate time_step
+    tracer_time_dim = trajectory_time_dim(path, tracers[0])
+    time_step = _trajectory_time_step(tracer_time_dim, time_dim_desired)
+    time_dim_desired = tracer_time_dim // time_step
+    assert tracer_time_dim == time_dim_desired * time_step
+
+    # load and average trajectory
+    for tracers_index, tracer in enumerate(tracers):
         util.logging.debug(f'Loading trajectory for tracer {tracer}.')
-        for time_index in range(time_dim_desired):
-            # average trajectory
-            for k in range(time_step):
-                # prepare filename
-                file_nr = time_index * time_step + k
-                filename = simulation.model.constants.METOS_TRAJECTORY_FILENAME.format(tracer=tracer, time_step=file_nr)
-                file = os.path.join(path, filename)
-
-                # load vector and average
-                vec = util.petsc.universal.load_petsc_vec_to_numpy_array(file)
-                if np.any(np.isnan(vec)):
-                    raise ValueError(f'Trajectory {file} contains nans.')
-                if set_negative_values_to_zero:
-                    vec[vec < 0] = 0
-                if k == 0:
-                    trajectory_averaged = vec
-                else:
-                    trajectory_averaged += vec
-
-            trajectory_averaged /= time_step
-
-            # convert trajectory
-            trajectory_averaged = convert_function(trajectory_averaged)
-            assert trajectory_averaged.shape == converted_result_shape
-
-            trajectory[tracers_index, time_index] = trajectory_averaged
+        loaded_vectors = _iterate_trajectory_vectors(path, tracer, time_indices=range(tracer_time_dim), max_workers=max_workers, prefetch=prefetch, use_memmap=use_memmap)
+        try:
+            for time_index in range(time_dim_desired):
+                # average trajectory
+                for k in range(time_step):
+                    # get next loaded vector
+                    vec_time_index, vec = next(loaded_vectors)
+                    assert vec_time_index == time_index * time_step + k
+
+                    # average vector (memory mapped vectors are only copied if needed)
+                    if np.any(np.isnan(vec)):
+                        raise ValueError(f'Trajectory in {path} for tracer {tracer} contains nans at time step {vec_time_index}.')
+                    if set_negative_values_to_zero:
+                        vec = np.maximum(vec, 0)
+                    if k == 0:
+                        if time_step > 1:
+                            trajectory_averaged = np.array(vec, dtype=np.float64)
+                        else:
+                            trajectory_averaged = vec
+                    else:
+                        trajectory_averaged += vec
+
+                if time_step > 1:
+                    trajectory_averaged /= time_step
+
+                # convert trajectory
+                if convert_function is not None:
+                    trajectory_averaged = convert_function(trajectory_averaged)
+
+                yield tracers_index, time_index, trajectory_averaged
+        finally:
+            loaded_vectors.close()
+
+
+def load_trajectories_to_universal(path, tracers, convert_function=None, converted_result_shape=None, time_dim_desired=None, set_negative_values_to_zero=False, max_workers=None, prefetch=None, use_memmap=None):
+    util.logging.debug(f'Loading trajectories with tracers {tracers}, desired time dim {time_dim_desired}, set_negative_values_to_zero {set_negative_values_to_zero} and convert function {convert_function} with result shape {converted_result_shape} from {path}.')
+
+    # check input
+    if isinstance(tracers, str):
+        tracers = [tracers]
+    if convert_function is None and converted_result_shape is not None:
+        raise ValueError(f'The convert function is None but the converted result shape is not None ({converted_result_shape}).')
+
+    # calculate time dim
+    tracer_time_dim = trajectory_time_dim(path, tracers[0])
+    time_dim_desired = tracer_time_dim // _trajectory_time_step(tracer_time_dim, time_dim_desired)
+
+    # load trajectory, result array is initialized with first slice
+    trajectory = None
+    for tracers_index, time_index, trajectory_averaged in iterate_trajectories_to_universal(path, tracers, convert_function=convert_function, time_dim_desired=time_dim_desired, set_negative_values_to_zero=set_negative_values_to_zero, max_workers=max_workers, prefetch=prefetch, use_memmap=use_memmap):
+        if trajectory is None:
+            if converted_result_shape is None:
+                converted_result_shape = trajectory_averaged.shape
+            trajectory_shape = (len(tracers), time_dim_desired) + converted_result_shape
+            util.logging.debug(f'Loading trajectories from {path} to array of size {trajectory_shape}.')
+            trajectory = np.empty(trajectory_shape, dtype=np.float64)
+        assert trajectory_averaged.shape == converted_result_shape
+        trajectory[tracers_index, time_index] = trajectory_averaged
 
     util.logging.debug(f'Trajectory with shape {trajectory.shape} loaded.')
 
     return trajectory
 
 
+def load_trajectories_to_universal_for_time_dims(path, tracers, time_dims, convert_function=None, set_negative_values_to_zero=False, max_workers=None, prefetch=None, use_memmap=None):
+    util.logging.debug(f'Loading trajectories with tracers {tracers} for time dims {time_dims}, set_negative_values_to_zero {set_negative_values_to_zero} and convert function {convert_function} from {path}.')
+
+    # check input
+    if isinstance(tracers, str):
+        tracers = [tracers]
+    if convert_function is not None and not callable(convert_function):
+        raise ValueError(f'The convert function {convert_function} has to be callable.')
+    time_dims = sorted(set(time_dims), reverse=True)
+
+    # iterate trajectory averaged to the least common multiple of time dims which divides the tracer time dim
+    tracer_time_dim = trajectory_time_dim(path, tracers[0])
+    for time_dim in time_dims:
+        _trajectory_time_step(tracer_time_dim, time_dim)
+    base_time_dim = int(np.lcm.reduce(time_dims))
+    time_steps = {time_dim: base_time_dim // time_dim for time_dim in time_dims}
+
+    # sum only coarser time aggregations in one pass, base time dim is written directly
+    vector_len = simulation.model.constants.METOS_VECTOR_LEN
+    trajectory_sums = {time_dim: np.zeros((len(tracers), time_dim, vector_len), dtype=np.float64) for time_dim in time_dims if time_dim != base_time_dim}
+
+    def converted_array(time_dim, converted_result_shape):
+        util.logging.debug(f'Loading trajectories from {path} to array of size {(len(tracers), time_dim) + converted_result_shape}.')
+        return np.empty((len(tracers), time_dim) + converted_result_shape, dtype=np.float64)
+
+    trajectories = {}
+    for tracers_index, time_index, vec in iterate_trajectories_to_universal(path, tracers, time_dim_desired=base_time_dim, set_negative_values_to_zero=set_negative_values_to_zero, max_workers=max_workers, prefetch=prefetch, use_memmap=use_memmap):
+        for time_dim, trajectory_sum in trajectory_sums.items():
+            trajectory_sum[tracers_index, time_index // time_steps[time_dim]] += vec
+        if base_time_dim in time_steps:
+            if convert_function is not None:
+                vec = convert_function(vec)
+            if base_time_dim not in trajectories:
+                trajectories[base_time_dim] = converted_array(base_time_dim, vec.shape)
+            trajectories[base_time_dim][tracers_index, time_index] = vec
+
+    # average and convert coarser trajectories
+    for time_dim, trajectory in trajectory_sums.items():
+        trajectory /= time_steps[time_dim]
+        if convert_function is not None:
+            trajectory_converted = None
+            for tracers_index, time_index in np.ndindex(trajectory.shape[:2]):
+                trajectory_averaged = convert_function(trajectory[tracers_index, time_index])
+                if trajectory_converted is None:
+                    trajectory_converted = converted_array(time_dim, trajectory_averaged.shape)
+                trajectory_converted[tracers_index, time_index] = trajectory_averaged
+            trajectory = trajectory_converted
+        trajectories[time_dim] = trajectory
+
+    for time_dim in time_dims:
+        util.logging.debug(f'Trajectory with shape {trajectories[time_dim].shape} loaded.')
+    return {time_dim: trajectories[time_dim] for time_dim in time_dims}
+
+
+def iterate_trajectories_to_map(path, tracers, time_dim_desired=None):
+    for tracers_index, time_index, trajectory_averaged in iterate_trajectories_to_universal(path, tracers, time_dim_desired=time_dim_desired):
+        yield tracers_index, time_index, convert_metos_1D_to_3D(trajectory_averaged)
+
+
 def load_trajectories_to_map(path, tracers, time_dim_desired=None):
-    # load trajectory
-    trajectory = load_trajectories_to_universal(path, tracers, convert_function=convert_metos_1D_to_3D, converted_result_shape=simulation.model.constants.METOS_SPACE_DIM, time_dim_desired=time_dim_desired)
-    trajectory = trajectory[0]
+    # fill map slice by slice to avoid an intermediate metos vector trajectory
+    if isinstance(tracers, str):
+        tracers = [tracers]
+    tracer_time_dim = trajectory_time_dim(path, tracers[0])
+    time_dim_desired = tracer_time_dim // _trajectory_time_step(tracer_time_dim, time_dim_desired)
+
+    METOS_LSM = simulation.model.constants.METOS_LSM
+    trajectory = np.full((time_dim_desired, METOS_LSM.x_dim, METOS_LSM.y_dim, METOS_LSM.z_dim), np.nan, dtype=np.float64)
+    index_map = metos_index_map()
+    for tracers_index, time_index, trajectory_averaged in iterate_trajectories_to_universal(path, tracers[:1], time_dim_desired=time_dim_desired):
+        trajectory[(time_index,) + index_map] = trajectory_averaged
 
     assert trajectory.ndim == 4
     return trajectory
 
 
-def load_trajectories_to_map_index_array(path, tracers, time_dim_desired=None):
-    # load trajectory with universal function
-    def convert_function(metos_vec):
-        trajectory = convert_metos_1D_to_3D(metos_vec)
-        data_mask = np.logical_not(np.isnan(trajectory))
-
-        data_indices = np.array(np.where(data_mask)).swapaxes(0, 1)
-        assert data_indices.ndim == 2
-        assert data_indices.shape[1] == 3
+def load_trajectories_to_map_for_time_dims(path, tracers, time_dims):
+    if isinstance(tracers, str):
+        tracers = [tracers]
+    # convert slice by slice to avoid intermediate metos vector trajectories
+    trajectories = load_trajectories_to_universal_for_time_dims(path, tracers[:1], time_dims, convert_function=convert_metos_1D_to_3D)
+    for time_dim in trajectories.keys():
+        trajectories[time_dim] = trajectories[time_dim][0]
+        assert trajectories[time_dim].ndim == 4
+    return trajectories
 
-        data_values = trajectory[data_mask].reshape([len(data_indices), 1])
-        assert data_values.ndim == 2
-        assert data_values.shape[1] == 1
-        assert len(data_indices) == len(data_values)
 
-        data = np.concatenate([data_indices, data_values], axis=1)
-        assert data.ndim == 2
-        assert data.shape[1] == 4
+@util.cache.memory.decorator()
+def _metos_index_map_sorted_order():
+    # order of metos vector entries if sorted by x, y and z index (as np.where for maps)
+    x_indices, y_indices, z_indices = metos_index_map()
+    return np.lexsort((z_indices, y_indices, x_indices))
 
-        return data
 
-    trajectory = load_trajectories_to_universal(path, tracers, convert_function=convert_function, time_dim_desired=time_dim_desired)
-    trajectory = trajectory[0]
-    assert trajectory.ndim == 3
-    assert np.all(trajectory[:, :, :3] % 1 == 0)
+def load_trajectories_to_map_index_array(path, tracers, time_dim_desired=None, time_indices=None, metos_indices=None):
+    if isinstance(tracers, str):
+        tracers = [tracers]
 
-    # convert time index to point value
-    t_dim, point_len_per_t, point_dim = trajectory.shape
-    trajectory_point_array = np.empty((t_dim * point_len_per_t, point_dim + 1))
-    for t_index in range(t_dim):
-        trajectory_point_array[t_index * point_len_per_t: (t_index + 1) * point_len_per_t, 0] = t_index
-        trajectory_point_array[t_index * point_len_per_t: (t_index + 1) * point_len_per_t, 1:] = trajectory[t_index]
+    # sparse map index array with only the passed pairs of time indices and metos vector indices
+    if time_indices is not None or metos_indices is not None:
+        if time_dim_desired is not None and time_dim_desired != trajectory_time_dim(path, tracers[0]):
+            raise ValueError(f'Only the time dimension of the trajectory is supported if time and metos indices are passed, but desired time dimension is {time_dim_desired}.')
+        time_indices = np.asarray(time_indices, dtype=np.int64)
+        metos_indices = np.asarray(metos_indices, dtype=np.int64)
+
+        # sort by time index and map index
+        metos_indices_rank = np.empty(simulation.model.constants.METOS_VECTOR_LEN, dtype=np.int64)
+        metos_indices_rank[_metos_index_map_sorted_order()] = np.arange(simulation.model.constants.METOS_VECTOR_LEN)
+        order = np.lexsort((metos_indices_rank[metos_indices], time_indices))
+        time_indices = time_indices[order]
+        metos_indices = metos_indices[order]
+
+        # convert time index and map indices to point values
+        trajectory_point_array = np.empty((len(time_indices), 5))
+        trajectory_point_array[:, 0] = time_indices
+        trajectory_point_array[:, 1:4] = np.array(metos_index_map()).swapaxes(0, 1)[metos_indices]
+        trajectory_point_array[:, 4] = load_trajectory_values(path, tracers[0], time_indices, metos_indices)
+
+    # map index array with all values
+    else:
+        tracer_time_dim = trajectory_time_dim(path, tracers[0])
+        t_dim = tracer_time_dim // _trajectory_time_step(tracer_time_dim, time_dim_desired)
+
+        # sort map indices by map index
+        order = _metos_index_map_sorted_order()
+        data_indices = np.array(metos_index_map()).swapaxes(0, 1)[order]
+        point_len_per_t = len(order)
+
+        # convert time index and map indices to point values and fill values slice by slice
+        trajectory_point_array = np.empty((t_dim, point_len_per_t, 5))
+        trajectory_point_array[:, :, 0] = np.arange(t_dim)[:, np.newaxis]
+        trajectory_point_array[:, :, 1:4] = data_indices[np.newaxis]
+        for tracers_index, time_index, trajectory_averaged in iterate_trajectories_to_universal(path, tracers[:1], time_dim_desired=t_dim):
+            trajectory_point_array[time_index, :, 4] = trajectory_averaged[order]
+        trajectory_point_array = trajectory_point_array.reshape(t_dim * point_len_per_t, 5)
 
     assert trajectory_point_array.ndim == 2
     assert trajectory_point_array.shape[1] == 5
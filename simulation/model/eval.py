@@ -1,14 +1,18 @@
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import json
 import os
 import tempfile
+import threading
 import warnings
 
 import numpy as np
 
 import util.io.fs
-import util.index_database.array_and_txt_file_based
-import util.index_database.petsc_file_based
 import util.pattern
-import util.math.interpolate
+import util.petsc.universal
 import util.math.finite_differences
 import util.batch.universal.system
 import util.options
@@ -19,9 +23,15 @@ import measurements.land_sea_mask.lsm
 import measurements.universal.data
 
 import simulation.constants
+import simulation.model.acceleration
 import simulation.model.data
+import simulation.model.index_database
+import simulation.model.interpolate
 import simulation.model.job
+import simulation.model.job_monitor
 import simulation.model.options
+import simulation.model.spinup_summary
+import simulation.model.trajectory_cache
 import simulation.model.constants
 
 
@@ -36,8 +46,11 @@ class Model_Database:
 
         self.database_output_dir = simulation.model.constants.DATABASE_OUTPUT_DIR
         self.start_from_closest_parameters = simulation.model.constants.MODEL_START_FROM_CLOSEST_PARAMETER_SET
+        self.warm_start_from_nearest_parameters = simulation.model.constants.MODEL_WARM_START_FROM_NEAREST_PARAMETER_SETS
+        self.spinup_acceleration = simulation.model.constants.MODEL_SPINUP_ACCELERATION
+        self.derivative_adaptive_tolerance = simulation.model.constants.MODEL_DERIVATIVE_ADAPTIVE_TOLERANCE
+        self.derivative_reuse_spinup_for_undisturbed_parameters = simulation.model.constants.MODEL_DERIVATIVE_REUSE_SPINUP_FOR_UNDISTURBED_PARAMETERS
         self.model_spinup_max_years = simulation.model.constants.MODEL_SPINUP_MAX_YEARS
-        self._cached_interpolator = None
 
         self.model_lsm = simulation.model.constants.METOS_LSM
 
@@ -104,7 +117,7 @@ class Model_Database:
 
         value_file = os.path.join(model_dir, simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_DIRNAME, simulation.model.constants.DATABASE_CONCENTRATIONS_DIRNAME, simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_FILENAME)
         array_file = os.path.join(model_dir, simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_DIRNAME, simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_LOOKUP_ARRAY_FILENAME)
-        constant_concentrations_db = util.index_database.array_and_txt_file_based.Database(array_file, value_file, value_reliable_decimal_places=simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES, tolerance_options=tolerance_options)
+        constant_concentrations_db = simulation.model.index_database.Database(array_file, value_file, value_reliable_decimal_places=simulation.model.constants.DATABASE_CONSTANT_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES, tolerance_options=tolerance_options)
 
         return constant_concentrations_db
 
@@ -117,7 +130,7 @@ class Model_Database:
         value_dir = os.path.join(model_dir, simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_DIRNAME, simulation.model.constants.DATABASE_CONCENTRATIONS_DIRNAME)
         concentration_filenames = [simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_FILENAME.format(tracer=tracer) for tracer in tracers]
 
-        vector_concentrations_db = util.index_database.petsc_file_based.Database(value_dir, concentration_filenames, value_reliable_decimal_places=simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES, tolerance_options=tolerance_options)
+        vector_concentrations_db = simulation.model.index_database.Vector_Database(value_dir, concentration_filenames, value_reliable_decimal_places=simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES, tolerance_options=tolerance_options)
         return vector_concentrations_db
 
     @property
@@ -214,7 +227,7 @@ class Model_Database:
         array_file = os.path.join(time_step_dir, simulation.model.constants.DATABASE_PARAMETERS_LOOKUP_ARRAY_FILENAME)
         value_file = os.path.join(time_step_dir, simulation.model.constants.DATABASE_PARAMETERS_DIRNAME, simulation.model.constants.DATABASE_PARAMETERS_FILENAME)
 
-        parameter_db = util.index_database.array_and_txt_file_based.Database(array_file, value_file, value_reliable_decimal_places=simulation.model.constants.DATABASE_PARAMETERS_RELIABLE_DECIMAL_PLACES, tolerance_options=parameter_tolerance_options)
+        parameter_db = simulation.model.index_database.Database(array_file, value_file, value_reliable_decimal_places=simulation.model.constants.DATABASE_PARAMETERS_RELIABLE_DECIMAL_PLACES, tolerance_options=parameter_tolerance_options)
         return parameter_db
 
     @property
@@ -254,7 +267,8 @@ class Model_Database:
         util.logging.debug(f'Searching for directory for parameters as close as possible to {parameters}.')
 
         # get closest indices
-        closest_index = self._parameters_db.closest_index(parameters)
+        with _database_lock:
+            closest_index = self._parameters_db.closest_index(parameters)
 
         # check if run dirs exist
         if self.last_run_dir(self.spinup_dir_with_index(closest_index)) is None:
@@ -323,8 +337,7 @@ class Model_Database:
             last_run_dir = os.path.join(search_path, last_run_dirname)
 
             # check job options file
-            with simulation.model.job.Metos3D_Job(last_run_dir, force_load=True):
-                pass
+            simulation.model.job.cached_job_properties(last_run_dir)
         else:
             last_run_dir = None
 
@@ -380,8 +393,13 @@ class Model_Database:
         else:
             util.logging.debug('No matching spinup run found.')
 
+            # no previous run exists and warm start from nearest parameters get blended concentrations
+            warm_start_files = None
+            if last_run_dir is None and self.warm_start_from_nearest_parameters and spinup_options.combination == 'or':
+                warm_start_files = self.make_warm_start(spinup_dir, spinup_options.years)
+
             # no previous run exists and starting from closest parameters get last run from closest parameters
-            if last_run_dir is None and self.start_from_closest_parameters:
+            if last_run_dir is None and warm_start_files is None and self.start_from_closest_parameters:
                 closest_spinup_dir = self.closest_spinup_dir
                 last_run_dir = self.last_run_dir(closest_spinup_dir)
 
@@ -405,9 +423,15 @@ class Model_Database:
                     util.logging.debug('Found previous run(s) with total {} years.'.format(last_years))
                     years = years - last_years
                     parameters = self.parameters
-                    with simulation.model.job.Metos3D_Job(last_run_dir, force_load=True) as job:
-                        concentration_files = job.tracer_output_files
-                    self.start_run(parameters, run_dir, years, tolerance=tolerance, job_options=self.job_options_for_kind('spinup'), tracer_input_files=concentration_files, wait_until_finished=True)
+                    concentration_files = self.run_summary(last_run_dir)['tracer_output_files']
+                    run_dir = self.start_spinup_runs(spinup_options, parameters, run_dir, years, tolerance=tolerance, tracer_input_files=concentration_files)
+                # start from warm start concentrations
+                elif warm_start_files is not None:
+                    warm_start_years = self._warm_start_years(run_dir)
+                    util.logging.debug(f'Starting from warm start concentrations which save {warm_start_years} years.')
+                    years = years - warm_start_years
+                    parameters = self.model_options.parameters
+                    run_dir = self.start_spinup_runs(spinup_options, parameters, run_dir, years, tolerance=tolerance, tracer_input_files=warm_start_files)
                 # make first run
                 else:
                     parameters = self.model_options.parameters
@@ -415,10 +439,10 @@ class Model_Database:
 
                     if initial_concentration_options.use_constant_concentrations:
                         constant_concentrations = self.initial_constant_concentrations
-                        self.start_run(parameters, run_dir, years, tolerance=tolerance, job_options=self.job_options_for_kind('spinup'), initial_constant_concentrations=constant_concentrations, wait_until_finished=True)
+                        run_dir = self.start_spinup_runs(spinup_options, parameters, run_dir, years, tolerance=tolerance, initial_constant_concentrations=constant_concentrations)
                     else:
                         concentration_files = self.initial_concentration_files
-                        self.start_run(parameters, run_dir, years, tolerance=tolerance, job_options=self.job_options_for_kind('spinup'), tracer_input_files=concentration_files, wait_until_finished=True)
+                        run_dir = self.start_spinup_runs(spinup_options, parameters, run_dir, years, tolerance=tolerance, tracer_input_files=concentration_files)
 
             else:
                 assert combination == 'and'
@@ -431,7 +455,38 @@ class Model_Database:
 
         return run_dir
 
-    def start_run(self, model_parameters, output_path, years, tolerance=0, job_options=None, write_trajectory=False, initial_constant_concentrations=None, tracer_input_files=None, total_concentration_factor=1, make_read_only=True, wait_until_finished=True):
+    def start_spinup_runs(self, spinup_options, model_parameters, run_dir, years, tolerance=0, initial_constant_concentrations=None, tracer_input_files=None):
+        # starts spinup in run_dir and returns the last run dir of the spinup
+        # with spinup acceleration the spinup is split into chained runs, each further run starts from the extrapolation of the annual states of its previous run
+        job_options = self.job_options_for_kind('spinup')
+        method = self.spinup_acceleration
+        if method is None:
+            self.start_run(model_parameters, run_dir, years, tolerance=tolerance, job_options=job_options, initial_constant_concentrations=initial_constant_concentrations, tracer_input_files=tracer_input_files, wait_until_finished=True)
+            return run_dir
+
+        spinup_dir = os.path.dirname(os.path.normpath(run_dir))
+        tracers = self.model_options.tracers
+        volumes = simulation.model.data.convert_3D_to_metos_1D(self.model_lsm.volume_map)
+        while True:
+            # run_dir is already created, so at least one year is run in it
+            run_years = max(min(years, simulation.model.constants.MODEL_SPINUP_ACCELERATION_YEARS), 1)
+            self.start_run(model_parameters, run_dir, run_years, tolerance=tolerance, job_options=job_options, write_annual_states=1, initial_constant_concentrations=initial_constant_concentrations, tracer_input_files=tracer_input_files, wait_until_finished=True)
+            years = years - self.real_years(run_dir, include_previous_runs=False)
+            # years may be counted from a chain of another spinup dir, so years can be exhausted without matching the options of this spinup dir
+            if years <= 0 or self.is_run_matching_options(run_dir, spinup_options, include_previous_runs=True):
+                simulation.model.acceleration.remove_annual_states(run_dir, tracers)
+                return run_dir
+
+            # extrapolate annual states, use output of run if extrapolation is not reliable
+            tracer_input_files = simulation.model.acceleration.extrapolate(run_dir, tracers, method, volumes)
+            simulation.model.acceleration.remove_annual_states(run_dir, tracers)
+            if tracer_input_files is None:
+                tracer_input_files = self.run_summary(run_dir)['tracer_output_files']
+            initial_constant_concentrations = None
+            run_dir = self.make_new_run_dir(spinup_dir)
+            util.logging.debug(f'Continuing accelerated spinup with {method} in {run_dir}.')
+
+    def start_run(self, model_parameters, output_path, years, tolerance=0, job_options=None, write_trajectory=False, write_annual_states=0, initial_constant_concentrations=None, tracer_input_files=None, total_concentration_factor=1, make_read_only=True, wait_until_finished=True):
 
         model_name = self.model_options.model_name
         time_step = self.model_options.time_step
@@ -439,7 +494,7 @@ class Model_Database:
         # execute job
         output_path_with_env = output_path.replace(simulation.constants.SIMULATION_OUTPUT_DIR, '${{{}}}'.format(simulation.constants.SIMULATION_OUTPUT_DIR_ENV_NAME))
         with simulation.model.job.Metos3D_Job(output_path_with_env) as job:
-            job.write_job_file(model_name, model_parameters, years=years, tolerance=tolerance, time_step=time_step, initial_constant_concentrations=initial_constant_concentrations, tracer_input_files=tracer_input_files, total_concentration_factor=total_concentration_factor, write_trajectory=write_trajectory, job_options=job_options)
+            job.write_job_file(model_name, model_parameters, years=years, tolerance=tolerance, time_step=time_step, initial_constant_concentrations=initial_constant_concentrations, tracer_input_files=tracer_input_files, total_concentration_factor=total_concentration_factor, write_trajectory=write_trajectory, write_annual_states=write_annual_states, job_options=job_options)
             job.start()
             job.make_read_only_input(make_read_only)
 
@@ -451,12 +506,32 @@ class Model_Database:
 
     #  *** access run properties *** #
 
+    def _finish_run(self, run_dir, job, make_read_only=True):
+        job.make_read_only_input(make_read_only)
+        job.make_read_only_output(make_read_only)
+        job.remove_tracer_info_files(force=False, not_exist_okay=True)
+        if self._is_spinup_run_dir(run_dir):
+            self._save_run_summary(run_dir, job)
+
+    def run_finished_future(self, run_dir, make_read_only=True):
+        finish_run = functools.partial(self._finish_run, run_dir, make_read_only=make_read_only)
+        if simulation.model.constants.JOB_MONITOR_USE:
+            return simulation.model.job_monitor.monitor().watch(run_dir, callback=finish_run)
+        else:
+            future = concurrent.futures.Future()
+            try:
+                with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
+                    job.make_read_only_input(make_read_only)
+                    job.wait_until_finished()
+                    finish_run(job)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+            return future
+
     def wait_until_run_finished(self, run_dir, make_read_only=True):
-        with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
-            job.make_read_only_input(make_read_only)
-            job.wait_until_finished()
-            job.make_read_only_output(make_read_only)
-            job.remove_tracer_info_files(force=False, not_exist_okay=True)
+        self.run_finished_future(run_dir, make_read_only=make_read_only).result()
 
     def is_run_matching_options(self, run_dir, spinup_options, include_previous_runs=True):
         if run_dir is not None:
@@ -489,28 +564,193 @@ class Model_Database:
 
         return is_matching
 
+    def _is_spinup_run_dir(self, run_dir):
+        return os.path.basename(os.path.dirname(os.path.normpath(run_dir))) == simulation.model.constants.DATABASE_SPINUP_DIRNAME
+
+    def _save_run_summary(self, run_dir, job, previous_total_years=None):
+        if previous_total_years is None:
+            if self._is_spinup_run_dir(run_dir):
+                previous_run_dir = self.previous_run_dir(run_dir)
+            else:
+                previous_run_dir = None
+            if previous_run_dir is not None:
+                previous_total_years = self.run_summary(previous_run_dir)['total_years']
+            else:
+                previous_total_years = self._warm_start_years(run_dir)
+        spinup_dir, run_dirname = os.path.split(os.path.normpath(os.path.expandvars(run_dir)))
+        return simulation.model.spinup_summary.Spinup_Summary(spinup_dir).add_run(run_dirname, job.last_year, job.last_tolerance, job.output_file, job.tracer_output_files, previous_total_years=previous_total_years)
+
+    def run_summary(self, run_dir):
+        # get summary of a run and, for spinup runs, its previous runs, missing or outdated summaries are created from the job outputs
+        run_dirs_without_summary = []
+        run_summary = None
+        while run_dir is not None and run_summary is None:
+            spinup_dir, run_dirname = os.path.split(os.path.normpath(os.path.expandvars(run_dir)))
+            run_summary = simulation.model.spinup_summary.Spinup_Summary(spinup_dir).run(run_dirname)
+            if run_summary is None:
+                run_dirs_without_summary.append(run_dir)
+                if self._is_spinup_run_dir(run_dir):
+                    run_dir = self.previous_run_dir(run_dir)
+                else:
+                    run_dir = None
+
+        for run_dir in reversed(run_dirs_without_summary):
+            util.logging.debug(f'Creating summary for run {run_dir}.')
+            if run_summary is not None:
+                previous_total_years = run_summary['total_years']
+            else:
+                previous_total_years = self._warm_start_years(run_dir)
+            with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
+                run_summary = self._save_run_summary(run_dir, job, previous_total_years=previous_total_years)
+
+        return run_summary
+
     def real_years(self, run_dir=None, include_previous_runs=True):
         if run_dir is None:
             run_dir = self.run_dir
-        real_years = 0
-        next = True
-        while next:
-            with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
-                years = job.last_year
-            real_years += years
-            if include_previous_runs:
-                run_dir = self.previous_run_dir(run_dir)
-                next = run_dir is not None
-            else:
-                next = False
-        return real_years
+        run_summary = self.run_summary(run_dir)
+        if include_previous_runs:
+            return run_summary['total_years']
+        else:
+            return run_summary['years']
 
     def real_tolerance(self, run_dir):
         if run_dir is None:
             run_dir = self.run_dir
-        with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
-            tolerance = job.last_tolerance
-        return tolerance
+        return self.run_summary(run_dir)['tolerance']
+
+    # *** warm start *** #
+
+    def _warm_start_dir(self, spinup_dir):
+        return os.path.join(spinup_dir, simulation.model.constants.DATABASE_WARM_START_DIRNAME)
+
+    def warm_start_info(self, spinup_dir):
+        info_file = os.path.join(self._warm_start_dir(spinup_dir), simulation.model.constants.DATABASE_WARM_START_INFO_FILENAME)
+        try:
+            with open(info_file, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _warm_start_years(self, run_dir):
+        # years saved by a warm start are counted as years of the first run of a spinup
+        if self._is_spinup_run_dir(run_dir):
+            spinup_dir = os.path.dirname(os.path.normpath(run_dir))
+            warm_start_info = self.warm_start_info(spinup_dir)
+            if warm_start_info is not None:
+                return warm_start_info['years']
+        return 0
+
+    def _finished_run_summary(self, run_dir):
+        # summary of run if it is finished, without waiting for it
+        spinup_dir, run_dirname = os.path.split(os.path.normpath(os.path.expandvars(run_dir)))
+        run_summary = simulation.model.spinup_summary.Spinup_Summary(spinup_dir).run(run_dirname)
+        if run_summary is None:
+            with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
+                is_finished = job.is_finished(check_exit_code=False)
+            if is_finished:
+                run_summary = self.run_summary(run_dir)
+        return run_summary
+
+    def _normalize_parameters(self, parameters):
+        # scaled by typical values since most parameter bounds are unbounded above
+        return np.asanyarray(parameters) / self.model_options.derivative_options.parameters_typical_values
+
+    def _nearest_finished_spinups(self):
+        # returns parameter set indices, normalized distances and summaries of last runs of the nearest finished spinups
+        number_of_parameter_sets = simulation.model.constants.MODEL_WARM_START_NUMBER_OF_PARAMETER_SETS
+        max_distance = simulation.model.constants.MODEL_WARM_START_MAX_DISTANCE
+
+        with _database_lock:
+            parameters_db = self._parameters_db
+            own_index = self.parameter_set_dir_index
+            indices = np.asarray(parameters_db.used_indices())
+            if len(indices) == 0:
+                return ()
+            values = np.array([parameters_db.get_value(index) for index in indices])
+        distances = np.linalg.norm(self._normalize_parameters(values) - self._normalize_parameters(self.model_options.parameters), axis=1)
+
+        nearest_spinups = []
+        for i in np.argsort(distances, kind='stable'):
+            if len(nearest_spinups) >= number_of_parameter_sets or distances[i] > max_distance:
+                break
+            if indices[i] != own_index:
+                last_run_dir = self.last_run_dir(self.spinup_dir_with_index(indices[i]))
+                if last_run_dir is not None:
+                    run_summary = self._finished_run_summary(last_run_dir)
+                    if run_summary is not None:
+                        nearest_spinups.append((indices[i], values[i], distances[i], run_summary))
+        return nearest_spinups
+
+    def _warm_start_weights(self, parameters, distances):
+        method = simulation.model.constants.MODEL_WARM_START_WEIGHTS
+        distances = np.asarray(distances)
+        if np.any(distances == 0):
+            weights = (distances == 0).astype(np.float64)
+        elif method == 'inverse_distance':
+            weights = distances**(- simulation.model.constants.MODEL_WARM_START_INVERSE_DISTANCE_POWER)
+        elif method == 'local_linear':
+            # affine weights reproducing the parameters as good as possible, weights = 1/k + N z with N spanning the vectors with sum zero
+            normalized_parameters = self._normalize_parameters(parameters)
+            normalized_parameters_own = self._normalize_parameters(self.model_options.parameters)
+            k = len(parameters)
+            weights_mean = np.ones(k) / k
+            null_space = np.linalg.svd(np.ones((1, k)))[2][1:].T
+            z = np.linalg.lstsq(normalized_parameters.T @ null_space, normalized_parameters_own - normalized_parameters.T @ weights_mean, rcond=None)[0]
+            weights = weights_mean + null_space @ z
+            if np.all(np.isfinite(weights)):
+                return weights
+            util.logging.debug(f'Local linear warm start weights {weights} are not finite. Inverse distance weights are used instead.')
+            weights = distances**(- simulation.model.constants.MODEL_WARM_START_INVERSE_DISTANCE_POWER)
+        else:
+            raise ValueError(f'Unknown warm start weights {method}.')
+        return weights / weights.sum()
+
+    def make_warm_start(self, spinup_dir, years):
+        # blend tracer outputs of nearest finished spinups to vector initial concentrations, returns their files or None if no spinups are available
+        nearest_spinups = self._nearest_finished_spinups()
+        if len(nearest_spinups) == 0:
+            util.logging.debug('No finished spinups for warm start available.')
+            return None
+        indices, parameters, distances, run_summaries = zip(*nearest_spinups)
+        weights = self._warm_start_weights(np.array(parameters), distances)
+        util.logging.debug(f'Warm start from parameter sets {indices} with distances {distances} and weights {weights}.')
+
+        # blend concentrations
+        tracers = self.model_options.tracers
+        volumes = simulation.model.data.convert_3D_to_metos_1D(self.model_lsm.volume_map)
+        concentrations = np.zeros((len(tracers), simulation.model.constants.METOS_VECTOR_LEN))
+        for weight, run_summary in zip(weights, run_summaries):
+            for i, tracer_output_file in enumerate(run_summary['tracer_output_files']):
+                concentrations[i] += weight * simulation.model.data.load_petsc_vec_to_memmap(tracer_output_file)
+
+        # remove negative concentrations and keep total mass of blend
+        concentrations = simulation.model.acceleration.remove_negative_values_keeping_mass(concentrations, volumes)
+
+        # save concentrations and info
+        warm_start_dir = self._warm_start_dir(spinup_dir)
+        os.makedirs(warm_start_dir, exist_ok=True)
+        warm_start_files = [os.path.join(warm_start_dir, simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_FILENAME.format(tracer=tracer)) for tracer in tracers]
+        for file, concentration in zip(warm_start_files, concentrations):
+            util.io.fs.remove_file(file, force=True, not_exist_okay=True)
+            util.petsc.universal.save_numpy_array_to_petsc_vec(file, concentration)
+            util.io.fs.make_read_only(file)
+
+        # saved years decrease linearly with the distance of the farthest used spinup and are zero at max distance
+        max_distance = max(distance for distance, weight in zip(distances, weights) if weight != 0)
+        distance_factor = max(1 - max_distance / simulation.model.constants.MODEL_WARM_START_MAX_DISTANCE, 0)
+        saved_years = int(distance_factor * min(run_summary['total_years'] for run_summary in run_summaries))
+        saved_years = max(min(saved_years, years - simulation.model.constants.MODEL_WARM_START_MIN_YEARS), 0)
+        warm_start_info = {'parameter_set_indices': [int(index) for index in indices],
+                           'distances': [float(distance) for distance in distances],
+                           'weights': [float(weight) for weight in weights],
+                           'method': simulation.model.constants.MODEL_WARM_START_WEIGHTS,
+                           'years': int(saved_years)}
+        info_file = os.path.join(warm_start_dir, simulation.model.constants.DATABASE_WARM_START_INFO_FILENAME)
+        with open(info_file, 'w') as file:
+            json.dump(warm_start_info, file, indent=1)
+        util.logging.info(f'Warm start concentrations in {warm_start_dir} blended from {len(indices)} spinups save {saved_years} years.')
+        return warm_start_files
 
     # *** job options *** #
 
@@ -612,9 +852,62 @@ class Model_Database:
             if last_run_dir is None:
                 raise DatabaseError(self, 'It is no run dir in {}!'.format(spinup_dir))
 
+    # *** concurrent evaluation *** #
+
+    def copy(self, model_options=None):
+        if model_options is None:
+            model_options = self.model_options
+        model_options = util.options.as_options(model_options, simulation.model.options.ModelOptions).copy()
+        model = type(self)(model_options=model_options, job_options=self.job_options)
+        for attribute in ('database_output_dir', 'start_from_closest_parameters', 'warm_start_from_nearest_parameters', 'spinup_acceleration', 'derivative_adaptive_tolerance', 'derivative_reuse_spinup_for_undisturbed_parameters', 'model_spinup_max_years', 'model_lsm'):
+            setattr(model, attribute, getattr(self, attribute))
+        return model
+
+    def _call_locked(self, method_name, *args, **kwargs):
+        # database lookups of different models are serialized, evaluations with the same spinup dir are serialized
+        with _database_lock:
+            spinup_dir = self.spinup_dir
+        with _spinup_dir_lock(spinup_dir):
+            return getattr(self, method_name)(*args, **kwargs)
+
+    async def _call_async(self, model_options, method_name, *args, **kwargs):
+        # evaluate method on an independent copy with model_options in a thread, so that many evaluations can be awaited concurrently
+        model = self.copy(model_options=model_options)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_async_executor(), functools.partial(model._call_locked, method_name, *args, **kwargs))
+
+
+_database_lock = threading.RLock()
+_spinup_dir_locks = {}
+_spinup_dir_locks_lock = threading.Lock()
+_async_executor_instance = None
+_async_executor_lock = threading.Lock()
+
+
+def _spinup_dir_lock(spinup_dir):
+    with _spinup_dir_locks_lock:
+        try:
+            return _spinup_dir_locks[spinup_dir]
+        except KeyError:
+            lock = threading.RLock()
+            _spinup_dir_locks[spinup_dir] = lock
+            return lock
+
+
+def _async_executor():
+    global _async_executor_instance
+    with _async_executor_lock:
+        if _async_executor_instance is None:
+            _async_executor_instance = concurrent.futures.ThreadPoolExecutor(max_workers=simulation.model.constants.MODEL_ASYNC_MAX_WORKERS)
+        return _async_executor_instance
+
 
 class Model_With_F(Model_Database):
 
+    @property
+    def _trajectory_cache(self):
+        return simulation.model.trajectory_cache.Trajectory_Cache(simulation.model.constants.DATABASE_TRAJECTORY_CACHE_DIR, simulation.model.constants.DATABASE_TRAJECTORY_CACHE_MAX_SIZE_GB)
+
     def check_tracers(self, tracers):
         if tracers is not None:
             tracers = tuple(tracers)
@@ -627,41 +920,50 @@ class Model_With_F(Model_Database):
 
     # *** access to model values (auxiliary) *** #
 
-    def _interpolate(self, data, interpolation_points, use_cache=False):
-        from .constants import MODEL_INTERPOLATOR_FILE, MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR, METOS_DIM
-
-        data_points = data[:, :-1]
-        data_values = data[:, -1]
-        interpolator_file = MODEL_INTERPOLATOR_FILE
-
-        # try to get cached interpolator
-        interpolator = self._cached_interpolator
-        if interpolator is not None:
-            interpolator.data_values = data_values
-            util.logging.debug('Returning cached interpolator.')
-        else:
-            # otherwise try to get saved interpolator
-            if use_cache and os.path.exists(interpolator_file):
-                interpolator = util.math.interpolate.Interpolator_Base.load(interpolator_file)
-                interpolator.data_values = data_values
-                util.logging.debug('Returning interpolator loaded from {}.'.format(interpolator_file))
-            # if no interpolator exists, create new interpolator
-            else:
-                interpolator = util.math.interpolate.Periodic_Interpolator(data_points=data_points, data_values=data_values, point_range_size=METOS_DIM, scaling_values=(METOS_DIM[1] / METOS_DIM[0], None, None, None), wrap_around_amount=MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, number_of_linear_interpolators=MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, single_overlapping_amount_linear_interpolators=MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR)
-                util.logging.debug('Returning new created interpolator.')
-
-            self._cached_interpolator = interpolator
-
-        # interpolate
-        interpolated_values = interpolator.interpolate(interpolation_points)
-
-        # save interpolate if cache used
-        if use_cache and not os.path.exists(interpolator_file):
-            interpolator.save(interpolator_file)
-
-        # return interpolated values
-        assert not np.any(np.isnan(interpolated_values))
-        return interpolated_values
+    def _interpolate(self, data, interpolation_points, use_cache=False, data_points_key=None):
+        time_dim = self.model_options.time_steps_per_year
+        return simulation.model.interpolate.interpolate_scattered(data, interpolation_points, time_dim, data_points_key=data_points_key, use_cache=use_cache)
+
+    def _interpolation_points(self, points):
+        from .constants import MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_ENGINE
+
+        interpolation_points = self.model_lsm.coordinates_to_map_indices(points, discard_year=True, int_indices=False)
+        assert interpolation_points.ndim == 2 and interpolation_points.shape[1] == 4
+
+        if MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR > 0 and MODEL_INTERPOLATOR_ENGINE == 'scattered':
+            for value_min, index in ([np.where(self.model_lsm.lsm > 0)[1].min(), 2], [0, 3]):
+                for k in range(len(interpolation_points)):
+                    if interpolation_points[k, index] < value_min:
+                        interpolation_points[k, index] = value_min
+            for value_max, index in ([np.where(self.model_lsm.lsm > 0)[1].max(), 2], [self.model_lsm.z_dim - 1, 3]):
+                for k in range(len(interpolation_points)):
+                    if interpolation_points[k, index] > value_max:
+                        interpolation_points[k, index] = value_max
+
+        return interpolation_points
+
+    def _is_interpolation_operator_supported(self):
+        # scattered interpolation is only equal to an operator for nearest interpolation on the full time resolution
+        from .constants import MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_ENGINE, METOS_T_DIM
+        return MODEL_INTERPOLATOR_ENGINE == 'grid' or (MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR == 0 and self.model_options.time_steps_per_year == METOS_T_DIM)
+
+    def _is_interpolation_operator_used(self):
+        return self._is_interpolation_operator_supported() and (simulation.model.constants.MODEL_INTERPOLATOR_ENGINE == 'grid' or simulation.model.constants.MODEL_INTERPOLATION_OPERATOR_USE)
+
+    def _interpolation_operator(self, interpolation_points):
+        time_dim = self.model_options.time_steps_per_year
+        return simulation.model.interpolate.interpolation_operator(interpolation_points, time_dim, use_cache=simulation.model.constants.MODEL_INTERPOLATION_OPERATOR_USE)
+
+    def _interpolate_all_values(self, all_values, points):
+        # interpolate values of all boxes with time dim of model given as maps (time, x, y, z, ...)
+        assert all_values.shape[0] == self.model_options.time_steps_per_year
+        if len(points) == 0:
+            return np.empty((0,) + all_values.shape[4:])
+        interpolation_operator = self._interpolation_operator(self._interpolation_points(points))
+        x_indices, y_indices, z_indices = simulation.model.data.metos_index_map()
+        metos_indices = interpolation_operator.metos_indices
+        values = all_values[interpolation_operator.time_indices, x_indices[metos_indices], y_indices[metos_indices], z_indices[metos_indices]]
+        return interpolation_operator.apply(values)
 
     def _trajectory_with_load_function(self, trajectory_load_function, run_dir, model_parameters, tracers=None):
         TMP_DIR = simulation.model.constants.DATABASE_TMP_DIR
@@ -674,32 +976,51 @@ class Model_With_F(Model_Database):
         # create and read trajectory
         if len(tracers) > 0:
 
-            # create trajectory
-            if TMP_DIR is not None:
-                tmp_dir = TMP_DIR
-                os.makedirs(tmp_dir, exist_ok=True)
-            else:
-                tmp_dir = run_dir
+            run_tracer_output_files, = simulation.model.job.cached_job_properties(run_dir, 'tracer_output_files')
 
-            # write trajectory
-            trajectory_dir = tempfile.mkdtemp(dir=tmp_dir, prefix='trajectory_tmp_')
+            # write trajectory function
+            def write_trajectory(trajectory_dir, consolidate_tracers):
+                self.start_run(model_parameters, trajectory_dir, years=1, tolerance=0, job_options=self.job_options_for_kind('trajectory'), tracer_input_files=run_tracer_output_files, write_trajectory=True, make_read_only=False)
 
-            with simulation.model.job.Metos3D_Job(run_dir, force_load=True) as job:
-                run_tracer_output_files = job.tracer_output_files
+                # consolidate trajectory
+                trajectory_output_dir = os.path.join(trajectory_dir, 'trajectory')
+                if simulation.model.constants.METOS_TRAJECTORY_CONSOLIDATE:
+                    simulation.model.data.consolidate_trajectory(trajectory_output_dir, tracers=consolidate_tracers, remove_petsc_files=True)
+                return trajectory_output_dir
 
-            self.start_run(model_parameters, trajectory_dir, years=1, tolerance=0, job_options=self.job_options_for_kind('trajectory'), tracer_input_files=run_tracer_output_files, write_trajectory=True, make_read_only=False)
+            # get cached trajectory for all tracers (creates it if not existing)
+            if simulation.model.constants.DATABASE_TRAJECTORY_CACHE_USE:
+                trajectory_cache = self._trajectory_cache
+                key = trajectory_cache.key(run_dir, model_parameters, run_tracer_output_files, self.model_options.model_name, self.model_options.time_step)
+                with trajectory_cache.use(key, lambda trajectory_dir: write_trajectory(trajectory_dir, self.model_options.tracers)) as trajectory_dir:
+                    trajectory_output_dir = os.path.join(trajectory_dir, 'trajectory')
 
-            # read trajectory
-            trajectory_output_dir = os.path.join(trajectory_dir, 'trajectory')
-            for tracer in tracers:
-                trajectory_values_tracer = trajectory_load_function(trajectory_output_dir, tracer=tracer)
-                trajectory_values[tracer] = trajectory_values_tracer
+                    # read trajectory
+                    for tracer in tracers:
+                        trajectory_values_tracer = trajectory_load_function(trajectory_output_dir, tracer=tracer)
+                        trajectory_values[tracer] = trajectory_values_tracer
 
-            # remove trajectory
-            try:
-                util.io.fs.remove_recursively(trajectory_dir, not_exist_okay=True, exclude_dir=False)
-            except OSError:
-                warnings.warn('Temporary trajectory directory {} could not be removed.'.format(trajectory_dir))
+            # write temporary trajectory only for passed tracers
+            else:
+                if TMP_DIR is not None:
+                    tmp_dir = TMP_DIR
+                    os.makedirs(tmp_dir, exist_ok=True)
+                else:
+                    tmp_dir = run_dir
+
+                trajectory_dir = tempfile.mkdtemp(dir=tmp_dir, prefix='trajectory_tmp_')
+                trajectory_output_dir = write_trajectory(trajectory_dir, tracers)
+
+                # read trajectory
+                for tracer in tracers:
+                    trajectory_values_tracer = trajectory_load_function(trajectory_output_dir, tracer=tracer)
+                    trajectory_values[tracer] = trajectory_values_tracer
+
+                # remove trajectory
+                try:
+                    util.io.fs.remove_recursively(trajectory_dir, not_exist_okay=True, exclude_dir=False)
+                except OSError:
+                    warnings.warn('Temporary trajectory directory {} could not be removed.'.format(trajectory_dir))
 
         # return
         assert len(trajectory_values) == len(tracers)
@@ -708,11 +1029,16 @@ class Model_With_F(Model_Database):
     def _trajectory_load_function_for_all(self, time_dim):
         def trajectory_load_function(trajectory_path, tracer):
             return simulation.model.data.load_trajectories_to_map(trajectory_path, tracer, time_dim_desired=time_dim)
+        trajectory_load_function.values_per_tracer = time_dim * np.prod(simulation.model.constants.METOS_SPACE_DIM)
         return trajectory_load_function
 
-    def _trajectory_load_function_for_points(self, points):
-        from .constants import MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR
+    def _trajectory_load_function_for_all_time_dims(self, time_dims):
+        def trajectory_load_function(trajectory_path, tracer):
+            return simulation.model.data.load_trajectories_to_map_for_time_dims(trajectory_path, tracer, time_dims)
+        trajectory_load_function.values_per_tracer = sum(time_dims) * np.prod(simulation.model.constants.METOS_SPACE_DIM)
+        return trajectory_load_function
 
+    def _trajectory_load_function_for_points(self, points):
         # convert points to map indices
         interpolation_points_dict = {}
 
@@ -727,20 +1053,17 @@ class Model_With_F(Model_Database):
 
             # convert interpolation points to map indices
             if len(points_for_tracer) > 0:
-                interpolation_points_for_tracer = self.model_lsm.coordinates_to_map_indices(points_for_tracer, discard_year=True, int_indices=False)
-                assert interpolation_points_for_tracer.ndim == 2 and interpolation_points_for_tracer.shape[1] == 4
-
-                if MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR > 0:
-                    for value_min, index in ([np.where(self.model_lsm.lsm > 0)[1].min(), 2], [0, 3]):
-                        for k in range(len(interpolation_points_for_tracer)):
-                            if interpolation_points_for_tracer[k, index] < value_min:
-                                interpolation_points_for_tracer[k, index] = value_min
-                    for value_max, index in ([np.where(self.model_lsm.lsm > 0)[1].max(), 2], [self.model_lsm.z_dim - 1, 3]):
-                        for k in range(len(interpolation_points_for_tracer)):
-                            if interpolation_points_for_tracer[k, index] > value_max:
-                                interpolation_points_for_tracer[k, index] = value_max
-
-                interpolation_points_dict[tracer] = interpolation_points_for_tracer
+                interpolation_points_dict[tracer] = self._interpolation_points(points_for_tracer)
+
+        # get interpolation operators or needed trajectory values if only nearest values are interpolated
+        interpolation_operator_dict = {}
+        trajectory_indices_dict = {}
+        if self._is_interpolation_operator_supported():
+            for tracer, interpolation_points_for_tracer in interpolation_points_dict.items():
+                if self._is_interpolation_operator_used():
+                    interpolation_operator_dict[tracer] = self._interpolation_operator(interpolation_points_for_tracer)
+                elif simulation.model.constants.MODEL_TRAJECTORY_SPARSE_LOADING:
+                    trajectory_indices_dict[tracer] = simulation.model.interpolate.trajectory_indices_for_points(interpolation_points_for_tracer, self.model_options.time_steps_per_year)
 
         # interpolate trajectory function
         def interpolate_trajectory(trajectory_path, tracer):
@@ -749,10 +1072,22 @@ class Model_With_F(Model_Database):
                 interpolation_points_for_tracer = interpolation_points_dict[tracer]
             except KeyError:
                 interpolated_values_for_tracer = np.empty([0])
-            # interpolate if points for tracer are available
             else:
-                tracer_trajectory = simulation.model.data.load_trajectories_to_map_index_array(trajectory_path, tracers=tracer)
-                interpolated_values_for_tracer = self._interpolate(tracer_trajectory, interpolation_points_for_tracer)
+                # apply interpolation operator if available
+                if tracer in interpolation_operator_dict:
+                    interpolation_operator = interpolation_operator_dict[tracer]
+                    tracer_values = simulation.model.data.load_trajectory_values(trajectory_path, tracer, interpolation_operator.time_indices, interpolation_operator.metos_indices)
+                    interpolated_values_for_tracer = interpolation_operator.apply(tracer_values)
+                # interpolate only needed values if possible
+                elif tracer in trajectory_indices_dict:
+                    time_indices, metos_indices = trajectory_indices_dict[tracer]
+                    tracer_trajectory = simulation.model.data.load_trajectories_to_map_index_array(trajectory_path, tracers=tracer, time_indices=time_indices, metos_indices=metos_indices)
+                    data_points_key = hashlib.sha1(time_indices.tobytes() + metos_indices.tobytes()).hexdigest()
+                    interpolated_values_for_tracer = self._interpolate(tracer_trajectory, interpolation_points_for_tracer, data_points_key=data_points_key)
+                # interpolate all values otherwise
+                else:
+                    tracer_trajectory = simulation.model.data.load_trajectories_to_map_index_array(trajectory_path, tracers=tracer)
+                    interpolated_values_for_tracer = self._interpolate(tracer_trajectory, interpolation_points_for_tracer)
             # return
             assert interpolated_values_for_tracer.ndim == 1
             return interpolated_values_for_tracer
@@ -833,6 +1168,12 @@ class Model_With_F(Model_Database):
 
         return f
 
+    def f_all_for_time_dims(self, time_dims, tracers=None):
+        util.logging.debug(f'Calculating all f values for tracers {tracers} with time dimensions {time_dims}.')
+        f = self._f(self._trajectory_load_function_for_all_time_dims(time_dims), tracers=tracers)
+        f = {time_dim: {tracer: f_tracer[time_dim] for tracer, f_tracer in f.items()} for time_dim in time_dims}
+        return f
+
     def f_points(self, points):
         util.logging.debug('Calculating f values at points for tracers {}.'.format(tuple(points.keys())))
 
@@ -852,66 +1193,236 @@ class Model_With_F(Model_Database):
 
 class Model_With_F_And_DF(Model_With_F):
 
-    @property
-    def derivative_dir(self):
+    def derivative_dir_for_years(self, derivative_years, adaptive_years=None):
+        # partial derivative runs continued in chunks of adaptive_years are kept apart from runs started from the spinup
         derivative_options = self.model_options.derivative_options
-        derivative_dir = os.path.join(self.parameter_set_dir, simulation.model.constants.DATABASE_DERIVATIVE_DIRNAME.format(spinup_real_years=self.real_years(include_previous_runs=True), derivative_step_size=derivative_options.step_size, derivative_years=derivative_options.years))
+        spinup_real_years = self.real_years(include_previous_runs=True)
+        if adaptive_years is None:
+            derivative_dirname = simulation.model.constants.DATABASE_DERIVATIVE_DIRNAME.format(spinup_real_years=spinup_real_years, derivative_step_size=derivative_options.step_size, derivative_years=derivative_years)
+        else:
+            derivative_dirname = simulation.model.constants.DATABASE_DERIVATIVE_ADAPTIVE_DIRNAME.format(spinup_real_years=spinup_real_years, derivative_step_size=derivative_options.step_size, adaptive_years=adaptive_years, derivative_years=derivative_years)
+        derivative_dir = os.path.join(self.parameter_set_dir, derivative_dirname)
         util.logging.debug('Returning derivative directory {}.'.format(derivative_dir))
         return derivative_dir
 
+    @property
+    def derivative_dir(self):
+        return self.derivative_dir_for_years(self.model_options.derivative_options.years)
+
     def _df(self, trajectory_load_function, tracers=None, include_total_concentration=False, derivative_order=1, accuracy_order=None):
-        # prepare needed options
-        if derivative_order is None:
-            derivative_order = 1
-        assert derivative_order in (1, 2)
-        if accuracy_order is None:
-            accuracy_order = self.model_options.derivative_options.accuracy_order
+        orders = self._derivative_orders(((derivative_order, accuracy_order),))
+        return self._df_for_orders(trajectory_load_function, orders, tracers=tracers, include_total_concentration=include_total_concentration)[orders[0]]
+
+    def _derivative_orders(self, orders):
+        # returns tuple of unique (derivative_order, accuracy_order) pairs with default values applied
+        normalized_orders = []
+        for derivative_order, accuracy_order in orders:
+            if derivative_order is None:
+                derivative_order = 1
+            assert derivative_order in (1, 2)
+            if accuracy_order is None:
+                accuracy_order = self.model_options.derivative_options.accuracy_order
+            if (derivative_order, accuracy_order) not in normalized_orders:
+                normalized_orders.append((derivative_order, accuracy_order))
+        return tuple(normalized_orders)
+
+    def _derivative_parameters(self, include_total_concentration=False):
+        # returns undisturbed parameters, typical values and bounds of the parameters used for derivatives
+        parameters_undisturbed = self.parameters
+        parameters_typical_values = self.model_options.derivative_options.parameters_typical_values
+        parameters_bounds = self.model_options.parameters_bounds
+        if include_total_concentration:
+            parameters_undisturbed = np.concatenate([parameters_undisturbed, np.array([1])])
+            parameters_typical_values = np.concatenate([parameters_typical_values, np.array([1])])
+            parameters_bounds = np.concatenate([parameters_bounds, np.array([[0, np.inf]])])
+        return parameters_undisturbed, parameters_typical_values, parameters_bounds
+
+    def _is_run_finished_after(self, run_dir, previous_run_dir):
+        # a continued run is only valid if it has finished after the run it continues, otherwise the previous run was recalculated since
+        output_file_state = self.run_summary(run_dir)['output_file_state']
+        previous_output_file_state = self.run_summary(previous_run_dir)['output_file_state']
+        return output_file_state is not None and previous_output_file_state is not None and output_file_state[1] >= previous_output_file_state[1]
+
+    def _start_partial_derivative_run(self, partial_derivative_dir, partial_derivative_parameters, spinup_matching_run_dir, derivative_years, run_years=None, previous_partial_derivative_dir=None, include_total_concentration=False):
+        # starts partial derivative run in partial_derivative_dir if no matching run exists there
+        # the run starts from the matching spinup run for derivative_years or continues the run in previous_partial_derivative_dir for run_years
+        spinup_options = self.model_options.spinup_options
+        os.makedirs(partial_derivative_dir, exist_ok=True)
+        util.logging.debug('Checking partial derivative runs in {}.'.format(partial_derivative_dir))
+
+        # check partial derivative dir
+        try:
+            partial_derivative_spinup_run_tracer_input_files, = simulation.model.job.cached_job_properties(partial_derivative_dir, 'model_tracer_input_files')
+        except util.batch.universal.system.JobOptionFileError:
+            matching_options = False
+        else:
+            partial_derivative_spinup_run_dir = [os.path.dirname(partial_derivative_spinup_run_tracer_input_file) for partial_derivative_spinup_run_tracer_input_file in partial_derivative_spinup_run_tracer_input_files]
+            assert all([partial_derivative_spinup_run_dir[0] == a for a in partial_derivative_spinup_run_dir[1:]])
+            partial_derivative_spinup_run_dir = partial_derivative_spinup_run_dir[0]
+            if previous_partial_derivative_dir is not None and os.path.normpath(os.path.expandvars(partial_derivative_spinup_run_dir)) == os.path.normpath(previous_partial_derivative_dir):
+                partial_derivative_options = {'years': run_years, 'tolerance': 0, 'combination': 'or'}
+                matching_options = self.is_run_matching_options(partial_derivative_dir, partial_derivative_options, include_previous_runs=False) and self._is_run_finished_after(partial_derivative_dir, previous_partial_derivative_dir)
+            else:
+                partial_derivative_options = {'years': derivative_years, 'tolerance': 0, 'combination': 'or'}
+                matching_options = self.is_run_matching_options(partial_derivative_dir, partial_derivative_options, include_previous_runs=False) and self.is_run_matching_options(partial_derivative_spinup_run_dir, spinup_options, include_previous_runs=True)
+
+        # make new run if run not matching
+        if not matching_options:
+            # remove old run
+            util.logging.debug('Old partial derivative run {} is not matching desired option. Its containt is removed.'.format(partial_derivative_dir))
+            util.io.fs.remove_recursively(partial_derivative_dir, not_exist_okay=True, exclude_dir=True)
+
+            # if no job setup available, get best job setup
+            job_options = self.job_options_for_kind('derivative')
+            if job_options['nodes_setup'] is None:
+                job_options['nodes_setup'] = util.batch.universal.system.NodeSetup(memory=simulation.model.constants.JOB_MEMORY_GB)
+
+            # get tracer input files
+            if previous_partial_derivative_dir is None:
+                tracer_input_run_dir = spinup_matching_run_dir
+                years = derivative_years
+            else:
+                tracer_input_run_dir = previous_partial_derivative_dir
+                years = run_years
+            tracer_input_run_dir_with_env = tracer_input_run_dir.replace(simulation.constants.SIMULATION_OUTPUT_DIR, '${{{}}}'.format(simulation.constants.SIMULATION_OUTPUT_DIR_ENV_NAME))
+            tracer_input_files = [os.path.join(tracer_input_run_dir_with_env, '{}_output.petsc'.format(tracer)) for tracer in self.model_options.tracers]
 
+            # start job
+            if include_total_concentration:
+                partial_derivative_model_parameters = partial_derivative_parameters[:-1]
+                total_concentration_factor = partial_derivative_parameters[-1]
+            else:
+                partial_derivative_model_parameters = partial_derivative_parameters
+                total_concentration_factor = 1
+            self.start_run(partial_derivative_model_parameters, partial_derivative_dir, years, tolerance=0, job_options=job_options, tracer_input_files=tracer_input_files, wait_until_finished=False, total_concentration_factor=total_concentration_factor)
+
+    def _partial_derivative_run_values(self, trajectory_load_function, tracers, partial_derivative_runs, include_total_concentration=False):
+        # returns dict with concatenated trajectories of tracers for each key in partial_derivative_runs which maps to (run_dir, parameters)
+        # runs are processed in order of completion, spinup runs are already finished
+        def calculate_partial_derivative_run_value(key):
+            run_dir, partial_derivative_parameters = partial_derivative_runs[key]
+            partial_derivative_model_parameters = partial_derivative_parameters[:-1] if include_total_concentration else partial_derivative_parameters
+            trajectory_dict = self._trajectory_with_load_function(trajectory_load_function, run_dir, partial_derivative_model_parameters)
+            return [trajectory_dict[tracer] for tracer in tracers]
+
+        # bound parallel loads by memory of loaded values (only known for loads of all boxes)
+        max_workers = simulation.model.constants.MODEL_DERIVATIVE_MAX_PARALLEL_RUN_PROCESSING
+        values_per_tracer = getattr(trajectory_load_function, 'values_per_tracer', None)
+        if values_per_tracer is not None:
+            load_size = len(tracers) * values_per_tracer * np.dtype(np.float64).itemsize
+            max_memory = simulation.model.constants.MODEL_DERIVATIVE_MAX_PARALLEL_RUN_PROCESSING_MEMORY_GB * 1024**3
+            max_workers = int(max(min(max_workers, max_memory // load_size), 1))
+        util.logging.debug(f'Processing {len(partial_derivative_runs)} partial derivative runs with {max_workers} workers in order of completion.')
+        run_futures = {self.run_finished_future(run_dir): key for key, (run_dir, partial_derivative_parameters) in partial_derivative_runs.items() if not self._is_spinup_run_dir(run_dir)}
+        partial_derivative_run_values = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(calculate_partial_derivative_run_value, key): key for key, (run_dir, partial_derivative_parameters) in partial_derivative_runs.items() if self._is_spinup_run_dir(run_dir)}
+            for run_future in concurrent.futures.as_completed(run_futures):
+                run_future.result()
+                key = run_futures[run_future]
+                futures[executor.submit(calculate_partial_derivative_run_value, key)] = key
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                partial_derivative_run_values[key] = future.result()
+                util.logging.debug(f'Partial derivative run {partial_derivative_runs[key][0]} processed ({len(partial_derivative_run_values)} of {len(futures)}).')
+        return partial_derivative_run_values
+
+    def _calculate_with_derivative_years(self, calculate_function):
+        # calls calculate_function(derivative_dir, derivative_years, run_years, previous_derivative_dir) which returns a dict of arrays
+        # in adaptive mode it is called for chunks of partial derivative spinup years until the arrays do not change anymore
         partial_derivative_spinup_years = self.model_options.derivative_options.years
+        adaptive_tolerance = self.derivative_adaptive_tolerance
+
+        # calculate with fixed partial derivative spinup years
+        if adaptive_tolerance is None:
+            derivative_dir = self.derivative_dir_for_years(partial_derivative_spinup_years)
+            values_dict = calculate_function(derivative_dir, partial_derivative_spinup_years, partial_derivative_spinup_years, None)
+
+        # calculate with partial derivative spinups in chunks until the values do not change anymore
+        else:
+            adaptive_years = simulation.model.constants.MODEL_DERIVATIVE_ADAPTIVE_YEARS
+            derivative_years = min(adaptive_years, partial_derivative_spinup_years)
+            derivative_dir = self.derivative_dir_for_years(derivative_years, adaptive_years=adaptive_years)
+            values_dict = calculate_function(derivative_dir, derivative_years, derivative_years, None)
+            while derivative_years < partial_derivative_spinup_years:
+                previous_derivative_dir = derivative_dir
+                previous_values_dict = values_dict
+                run_years = min(adaptive_years, partial_derivative_spinup_years - derivative_years)
+                derivative_years += run_years
+                derivative_dir = self.derivative_dir_for_years(derivative_years, adaptive_years=adaptive_years)
+                values_dict = calculate_function(derivative_dir, derivative_years, run_years, previous_derivative_dir)
+                change = np.sqrt(sum(np.linalg.norm(values_dict[key] - previous_values_dict[key])**2 for key in values_dict))
+                norm = np.sqrt(sum(np.linalg.norm(values_dict[key])**2 for key in values_dict))
+                util.logging.debug(f'Derivative with {derivative_years} partial derivative spinup years has changed by {change} with norm {norm}.')
+                if change <= adaptive_tolerance * norm:
+                    break
+            util.logging.info(f'Derivative calculated adaptively with {derivative_years} partial derivative spinup years.')
+
+        return values_dict
+
+    @staticmethod
+    def _split_concatenated_tracers(concatenated, tracers, tracer_start_stop_indices):
+        util.logging.debug('Unpacking values with shape {} for tracers with tracer_start_stop_indices {}.'.format(concatenated.shape, tracer_start_stop_indices))
+        assert len(tracer_start_stop_indices) == len(tracers) + 1
+        assert max(tracer_start_stop_indices) == len(concatenated)
+        return {tracer: concatenated[tracer_start_stop_indices[tracer_index]: tracer_start_stop_indices[tracer_index + 1]] for tracer_index, tracer in enumerate(tracers)}
+
+    @staticmethod
+    def _concatenate_tracers(trajectory_list, tracer_start_stop_indices):
+        # store length of each tracer
+        if len(tracer_start_stop_indices) == 1:
+            start_index = 0
+            for trajectory in trajectory_list:
+                stop_index = start_index + len(trajectory)
+                tracer_start_stop_indices.append(stop_index)
+                start_index = stop_index
+
+        # concatenate and return
+        return np.concatenate(trajectory_list)
+
+    def _df_for_orders(self, trajectory_load_function, orders, tracers=None, include_total_concentration=False):
+        # calculates derivatives for all (derivative_order, accuracy_order) pairs in orders
+        # the union of the needed partial derivative runs is planned first so that each run is started only once
+        orders = self._derivative_orders(orders)
+
+        # prepare needed options
         step_size = self.model_options.derivative_options.step_size
-        partial_derivative_options = {'years': partial_derivative_spinup_years, 'tolerance': 0, 'combination': 'or'}
-        spinup_options = self.model_options.spinup_options
+        reuse_spinup = self.derivative_reuse_spinup_for_undisturbed_parameters
 
-        util.logging.debug(f'Calculating derivative of order {derivative_order} with accurarcy order {accuracy_order} and spinup years {partial_derivative_spinup_years} and step size {step_size}.')
+        util.logging.debug(f'Calculating derivatives of derivative and accurarcy orders {orders} and spinup years {self.model_options.derivative_options.years}, step size {step_size} and adaptive tolerance {self.derivative_adaptive_tolerance}.')
 
         # check tracers
         tracers = self.check_tracers(tracers)
 
         # return empty array if no tracer wanted
         if len(tracers) == 0:
-            return {}
+            return {order: {} for order in orders}
 
         # model parameters
-        model_parameter = self.parameters
         parameters_len = self.model_options.parameters_len
         if include_total_concentration:
             parameters_len += 1
+        partial_derivative_parameters_undisturbed, partial_derivative_parameters_typical_values, partial_derivative_parameters_bounds = self._derivative_parameters(include_total_concentration=include_total_concentration)
 
-        # apply include_total_concentration
-        def convert_partial_derivative_parameters_to_start_run_parameters(partial_derivative_parameters):
-            assert len(partial_derivative_parameters) == parameters_len
-            if include_total_concentration:
-                return {'model_parameters': partial_derivative_parameters[:-1], 'total_concentration_factor': partial_derivative_parameters[-1]}
-            else:
-                return {'model_parameters': partial_derivative_parameters, 'total_concentration_factor': 1}
-
-        partial_derivative_parameters_bounds = self.model_options.parameters_bounds
-        partial_derivative_parameters_typical_values = self.model_options.derivative_options.parameters_typical_values
-        partial_derivative_parameters_undisturbed = model_parameter
-        if include_total_concentration:
-            partial_derivative_parameters_bounds = np.concatenate([partial_derivative_parameters_bounds, np.array([[0, np.inf]])])
-            partial_derivative_parameters_typical_values = np.concatenate([partial_derivative_parameters_typical_values, np.array([1])])
-            partial_derivative_parameters_undisturbed = np.concatenate([partial_derivative_parameters_undisturbed, np.array([1])])
-
-        # get derivative dir and spinup run dir (starts also spinup if not existing)
-        derivative_dir = self.derivative_dir
-        spinup_matching_run_dir = self.matching_run_dir(spinup_options)
+        # get spinup run dir (starts also spinup if not existing)
+        spinup_matching_run_dir = self.matching_run_dir(self.model_options.spinup_options)
 
         # define evaluation functions for finite differences
-        job_options = self.job_options_for_kind('derivative')
-        partial_derivative_dirs = {}
+        tracer_start_stop_indices = [0]
+
+        def calculate_derivative(function, derivative_order, accuracy_order):
+            if derivative_order == 1:
+                df_concatenated = util.math.finite_differences.first_derivative(function, partial_derivative_parameters_undisturbed, f_x=None, typical_x=partial_derivative_parameters_typical_values, bounds=partial_derivative_parameters_bounds, eps=step_size, use_always_typical_x=True, accuracy_order=accuracy_order)
+                assert df_concatenated.shape[0] == parameters_len
+                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
+            else:
+                df_concatenated = util.math.finite_differences.second_derivative(function, partial_derivative_parameters_undisturbed, f_x=None, typical_x=partial_derivative_parameters_typical_values, bounds=partial_derivative_parameters_bounds, eps=step_size, use_always_typical_x=True, accuracy_order=accuracy_order)
+                assert df_concatenated.shape[:2] == (parameters_len, parameters_len)
+                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
+                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
+            return df_concatenated
 
-        def start_partial_derivative_run(partial_derivative_parameters):
+        def partial_derivative_dirname(partial_derivative_parameters):
             # get changed parameters and corresponding ids
             changed_parameters_indices = np.where(partial_derivative_parameters != partial_derivative_parameters_undisturbed)[0]
             if len(changed_parameters_indices) == 0:
@@ -933,100 +1444,152 @@ class Model_With_F_And_DF(Model_With_F):
                     factor_id = DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID.format(index=parameter_index, h_factor=h_factor)
                     factor_ids.append(factor_id)
             factor_ids = simulation.model.constants.DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_SEPARATOR.join(factor_ids)
+            return simulation.model.constants.DATABASE_PARTIAL_DERIVATIVE_DIRNAME.format(factor_ids=factor_ids)
+
+        def calculate_derivatives_for_years(derivative_dir, derivative_years, run_years, previous_derivative_dir):
+            # partial derivative runs in derivative_dir start from the matching spinup run or continue the partial derivative runs in previous_derivative_dir for run_years
+
+            # plan union of partial derivative runs of all orders
+            planned_partial_derivative_parameters = {}
+
+            def plan_partial_derivative_run(partial_derivative_parameters):
+                planned_partial_derivative_parameters[tuple(partial_derivative_parameters)] = None
+                return 0
+
+            for derivative_order, accuracy_order in orders:
+                calculate_derivative(plan_partial_derivative_run, derivative_order, accuracy_order)
+            undisturbed = tuple(partial_derivative_parameters_undisturbed)
+            reuse_spinup_for_undisturbed = reuse_spinup and undisturbed in planned_partial_derivative_parameters
+            number_of_runs = len(planned_partial_derivative_parameters) - int(reuse_spinup_for_undisturbed)
+            util.logging.info(f'{number_of_runs} partial derivative runs with {derivative_years} years are needed for derivative and accuracy orders {orders} in {derivative_dir}.')
+
+            # start all partial derivative runs, undisturbed parameters can use matching spinup run
+            partial_derivative_runs = {}
+            for key in planned_partial_derivative_parameters:
+                partial_derivative_parameters = np.array(key)
+                if reuse_spinup_for_undisturbed and key == undisturbed:
+                    partial_derivative_dir = spinup_matching_run_dir
+                else:
+                    dirname = partial_derivative_dirname(partial_derivative_parameters)
+                    partial_derivative_dir = os.path.join(derivative_dir, dirname)
+                    if previous_derivative_dir is not None:
+                        previous_partial_derivative_dir = os.path.join(previous_derivative_dir, dirname)
+                    else:
+                        previous_partial_derivative_dir = None
+                    self._start_partial_derivative_run(partial_derivative_dir, partial_derivative_parameters, spinup_matching_run_dir, derivative_years, run_years=run_years, previous_partial_derivative_dir=previous_partial_derivative_dir, include_total_concentration=include_total_concentration)
+                partial_derivative_runs[key] = (partial_derivative_dir, partial_derivative_parameters)
 
-            # make partial_derivative_dirname
-            partial_derivative_dirname = simulation.model.constants.DATABASE_PARTIAL_DERIVATIVE_DIRNAME.format(factor_ids=factor_ids)
-            partial_derivative_dir = os.path.join(derivative_dir, partial_derivative_dirname)
-            os.makedirs(partial_derivative_dir, exist_ok=True)
-            util.logging.debug('Checking partial derivative runs in {}.'.format(partial_derivative_dir))
-
-            # check partial derivative dir
-            try:
-                with simulation.model.job.Metos3D_Job(partial_derivative_dir, force_load=True) as job:
-                    partial_derivative_spinup_run_tracer_input_files = job.model_tracer_input_files
-            except util.batch.universal.system.JobOptionFileError:
-                matching_options = False
-            else:
-                partial_derivative_spinup_run_dir = [os.path.dirname(partial_derivative_spinup_run_tracer_input_file) for partial_derivative_spinup_run_tracer_input_file in partial_derivative_spinup_run_tracer_input_files]
-                assert all([partial_derivative_spinup_run_dir[0] == a for a in partial_derivative_spinup_run_dir[1:]])
-                partial_derivative_spinup_run_dir = partial_derivative_spinup_run_dir[0]
-                matching_options = self.is_run_matching_options(partial_derivative_dir, partial_derivative_options, include_previous_runs=False) and self.is_run_matching_options(partial_derivative_spinup_run_dir, spinup_options, include_previous_runs=True)
+            # process partial derivative runs in order of completion
+            partial_derivative_run_values = self._partial_derivative_run_values(trajectory_load_function, tracers, partial_derivative_runs, include_total_concentration=include_total_concentration)
 
-            # make new run if run not matching
-            if not matching_options:
-                # remove old run
-                util.logging.debug('Old partial derivative run {} is not matching desired option. Its containt is removed.'.format(partial_derivative_dir))
-                util.io.fs.remove_recursively(partial_derivative_dir, not_exist_okay=True, exclude_dir=True)
+            def get_partial_derivative_run_value(partial_derivative_parameters):
+                return self._concatenate_tracers(partial_derivative_run_values[tuple(partial_derivative_parameters)], tracer_start_stop_indices)
 
-                # if no job setup available, get best job setup
-                if job_options['nodes_setup'] is None:
-                    job_options['nodes_setup'] = util.batch.universal.system.NodeSetup(memory=simulation.model.constants.JOB_MEMORY_GB)
+            # calculate deviations
+            return {(derivative_order, accuracy_order): calculate_derivative(get_partial_derivative_run_value, derivative_order, accuracy_order) for derivative_order, accuracy_order in orders}
 
-                # get tracer input files
-                spinup_matching_run_dir_with_env = spinup_matching_run_dir.replace(simulation.constants.SIMULATION_OUTPUT_DIR, '${{{}}}'.format(simulation.constants.SIMULATION_OUTPUT_DIR_ENV_NAME))
-                tracer_input_filenames = ['{}_output.petsc'.format(tracer) for tracer in self.model_options.tracers]
-                tracer_input_files = [os.path.join(spinup_matching_run_dir_with_env, tracer_input_filename) for tracer_input_filename in tracer_input_filenames]
+        df_concatenated_dict = self._calculate_with_derivative_years(calculate_derivatives_for_years)
 
-                # start job
-                start_run_parameters_dict = convert_partial_derivative_parameters_to_start_run_parameters(partial_derivative_parameters)
-                partial_derivative_model_parameters = start_run_parameters_dict['model_parameters']
-                total_concentration_factor = start_run_parameters_dict['total_concentration_factor']
-                self.start_run(partial_derivative_model_parameters, partial_derivative_dir, partial_derivative_spinup_years, tolerance=0, job_options=job_options, tracer_input_files=tracer_input_files, wait_until_finished=False, total_concentration_factor=total_concentration_factor)
+        # unpack concatenation
+        return {order: self._split_concatenated_tracers(df_concatenated, tracers, tracer_start_stop_indices) for order, df_concatenated in df_concatenated_dict.items()}
+
+    def direction_hash(self, direction):
+        # hash of the normalized direction used for directional derivative dirs and cache files
+        direction = np.asarray(direction, dtype=np.float64)
+        direction_norm = np.linalg.norm(direction)
+        if not np.isfinite(direction_norm) or direction_norm == 0:
+            raise ValueError(f'The direction {direction} must be finite and not zero.')
+        direction = np.round(direction / direction_norm, decimals=simulation.model.constants.DATABASE_DIRECTION_HASH_DECIMALS) + 0.0
+        return hashlib.sha256(direction.tobytes()).hexdigest()[:simulation.model.constants.DATABASE_DIRECTION_HASH_LENGTH]
+
+    @staticmethod
+    def _scale_values(values, factor):
+        # multiplies arrays in (nested) dicts of values
+        if isinstance(values, dict):
+            return {key: Model_With_F_And_DF._scale_values(value, factor) for key, value in values.items()}
+        else:
+            return values * factor
 
-            # save partial_derivative_dir
-            partial_derivative_dirs[tuple(partial_derivative_parameters)] = partial_derivative_dir
-            return 0
+    def _dfu(self, trajectory_load_function, direction, tracers=None, include_total_concentration=False, accuracy_order=None):
+        # calculates directional derivative DF * direction / |direction| with partial derivative runs along the normalized direction
+        if accuracy_order is None:
+            accuracy_order = self.model_options.derivative_options.accuracy_order
+        if accuracy_order not in (1, 2):
+            raise ValueError(f'Accuracy order {accuracy_order} is not supported for directional derivatives. Possible accuracy orders are 1 and 2.')
+        step_size = self.model_options.derivative_options.step_size
 
-        tracer_start_stop_indices = [0]
+        # check tracers
+        tracers = self.check_tracers(tracers)
 
-        def get_partial_derivative_run_value(partial_derivative_parameters):
-            # wait partial derivative run to finish
-            partial_derivative_dir = partial_derivative_dirs[tuple(partial_derivative_parameters)]
-            self.wait_until_run_finished(partial_derivative_dir)
+        # return empty array if no tracer wanted
+        if len(tracers) == 0:
+            return {}
 
-            # get trajectory
-            partial_derivative_model_parameters = convert_partial_derivative_parameters_to_start_run_parameters(partial_derivative_parameters)['model_parameters']
-            trajectory_dict = self._trajectory_with_load_function(trajectory_load_function, partial_derivative_dir, partial_derivative_model_parameters)
-            trajectory_list = [trajectory_dict[tracer] for tracer in tracers]
+        # check direction
+        parameters_undisturbed, parameters_typical_values, parameters_bounds = self._derivative_parameters(include_total_concentration=include_total_concentration)
+        direction = np.asarray(direction, dtype=np.float64)
+        if direction.shape != parameters_undisturbed.shape:
+            raise ValueError(f'The direction must have shape {parameters_undisturbed.shape}, but its shape is {direction.shape}.')
+        direction_hash = self.direction_hash(direction)
+        direction_normalized = direction / np.linalg.norm(direction)
+
+        # choose step along direction and h factors of difference quotient
+        h = step_size * np.linalg.norm(parameters_typical_values * direction_normalized)
+
+        def is_within_bounds(h_factor):
+            parameters = parameters_undisturbed + h_factor * h * direction_normalized
+            return np.all(parameters >= parameters_bounds[:, 0]) and np.all(parameters <= parameters_bounds[:, 1])
+
+        if accuracy_order == 2 and is_within_bounds(1) and is_within_bounds(-1):
+            h_factors = (1, -1)
+        elif is_within_bounds(1):
+            h_factors = (1, 0)
+        elif is_within_bounds(-1):
+            h_factors = (0, -1)
+        else:
+            raise ValueError(f'The parameters {parameters_undisturbed} disturbed along direction {direction} are not within the bounds {parameters_bounds}.')
 
-            # store length of each tracer
-            if len(tracer_start_stop_indices) == 1:
-                start_index = 0
-                for trajectory in trajectory_list:
-                    stop_index = start_index + len(trajectory)
-                    tracer_start_stop_indices.append(stop_index)
-                    start_index = stop_index
+        util.logging.debug(f'Calculating directional derivative along direction {direction} with hash {direction_hash}, step {h}, h factors {h_factors} and spinup years {self.model_options.derivative_options.years}.')
 
-            # concatenate and return
-            trajectory = np.concatenate(trajectory_list)
-            return trajectory
+        # get spinup run dir (starts also spinup if not existing)
+        spinup_matching_run_dir = self.matching_run_dir(self.model_options.spinup_options)
+        tracer_start_stop_indices = [0]
 
-        # calculate deviation
-        for function in (start_partial_derivative_run, get_partial_derivative_run_value):
-            if derivative_order == 1:
-                df_concatenated = util.math.finite_differences.first_derivative(function, partial_derivative_parameters_undisturbed, f_x=None, typical_x=partial_derivative_parameters_typical_values, bounds=partial_derivative_parameters_bounds, eps=step_size, use_always_typical_x=True, accuracy_order=accuracy_order)
-                assert df_concatenated.shape[0] == parameters_len
-                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
-            else:
-                df_concatenated = util.math.finite_differences.second_derivative(function, partial_derivative_parameters_undisturbed, f_x=None, typical_x=partial_derivative_parameters_typical_values, bounds=partial_derivative_parameters_bounds, eps=step_size, use_always_typical_x=True, accuracy_order=accuracy_order)
-                assert df_concatenated.shape[:2] == (parameters_len, parameters_len)
-                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
-                df_concatenated = np.moveaxis(df_concatenated, 0, -1)
+        def calculate_directional_derivative_for_years(derivative_dir, derivative_years, run_years, previous_derivative_dir):
+            # start partial derivative runs along direction, undisturbed parameters can use matching spinup run
+            partial_derivative_runs = {}
+            for h_factor in h_factors:
+                partial_derivative_parameters = parameters_undisturbed + h_factor * h * direction_normalized
+                if h_factor == 0 and self.derivative_reuse_spinup_for_undisturbed_parameters:
+                    partial_derivative_dir = spinup_matching_run_dir
+                else:
+                    if h_factor == 0:
+                        factor_id = simulation.model.constants.DATABASE_PARTIAL_DERIVATIVE_FACTOR_ID_INT.format(index=-1, h_factor=0)
+                        dirname = simulation.model.constants.DATABASE_PARTIAL_DERIVATIVE_DIRNAME.format(factor_ids=factor_id)
+                    else:
+                        dirname = simulation.model.constants.DATABASE_DIRECTIONAL_DERIVATIVE_DIRNAME.format(direction_hash=direction_hash, h_factor=h_factor)
+                    partial_derivative_dir = os.path.join(derivative_dir, dirname)
+                    if previous_derivative_dir is not None:
+                        previous_partial_derivative_dir = os.path.join(previous_derivative_dir, dirname)
+                    else:
+                        previous_partial_derivative_dir = None
+                    self._start_partial_derivative_run(partial_derivative_dir, partial_derivative_parameters, spinup_matching_run_dir, derivative_years, run_years=run_years, previous_partial_derivative_dir=previous_partial_derivative_dir, include_total_concentration=include_total_concentration)
+                    if h_factor != 0:
+                        direction_file = os.path.join(partial_derivative_dir, simulation.model.constants.DATABASE_DIRECTION_FILENAME)
+                        if not os.path.exists(direction_file):
+                            np.savetxt(direction_file, direction_normalized)
+                partial_derivative_runs[h_factor] = (partial_derivative_dir, partial_derivative_parameters)
+
+            # calculate difference quotient
+            partial_derivative_run_values = self._partial_derivative_run_values(trajectory_load_function, tracers, partial_derivative_runs, include_total_concentration=include_total_concentration)
+            values = [self._concatenate_tracers(partial_derivative_run_values[h_factor], tracer_start_stop_indices) for h_factor in h_factors]
+            dfu_concatenated = (values[0] - values[1]) / ((h_factors[0] - h_factors[1]) * h)
+            return {direction_hash: dfu_concatenated}
+
+        dfu_concatenated = self._calculate_with_derivative_years(calculate_directional_derivative_for_years)[direction_hash]
 
         # unpack concatenation
-        util.logging.debug('Unpacking derivative with shape {} for tracers with tracer_start_stop_indices {}.'.format(df_concatenated.shape, tracer_start_stop_indices))
-        assert len(tracer_start_stop_indices) == len(tracers) + 1
-        assert max(tracer_start_stop_indices) == len(df_concatenated)
-
-        df = {}
-        for tracer_index in range(len(tracers)):
-            df_tracer = df_concatenated[tracer_start_stop_indices[tracer_index]: tracer_start_stop_indices[tracer_index + 1]]
-            tracer = tracers[tracer_index]
-            df[tracer] = df_tracer
-
-        # return
-        assert len(df) == len(tracers)
-        return df
+        return self._split_concatenated_tracers(dfu_concatenated, tracers, tracer_start_stop_indices)
 
     # *** access to model values *** #
 
@@ -1063,6 +1626,81 @@ class Model_With_F_And_DF(Model_With_F):
                               include_total_concentration=include_total_concentration,
                               derivative_order=derivative_order, accuracy_order=accuracy_order)
 
+    def df_all_for_orders(self, time_dim, orders, tracers=None, include_total_concentration=False):
+        # returns dict with df values for each (derivative_order, accuracy_order) pair in orders, shared partial derivative runs are only started once
+        tracers = self.check_tracers(tracers)
+
+        util.logging.debug(f'Calculating all df values for tracers {tracers} with time dimension {time_dim}, include_total_concentration {include_total_concentration} and derivative and accuracy orders {orders}.')
+
+        df_dict = self._df_for_orders(self._trajectory_load_function_for_all(time_dim=time_dim), orders,
+                                      include_total_concentration=include_total_concentration,
+                                      tracers=tracers)
+        return df_dict
+
+    def df_points_for_orders(self, points, orders, include_total_concentration=False):
+        util.logging.debug(f'Calculating df values at points {tuple(map(len, points))}, include_total_concentration {include_total_concentration} and derivative and accuracy orders {orders}.')
+
+        points, split_dict = self._merge_data_sets(points)
+        df_dict = self._df_for_orders(self._trajectory_load_function_for_points(points), orders,
+                                      include_total_concentration=include_total_concentration)
+        df_dict = {order: self._split_data_sets(df, split_dict) for order, df in df_dict.items()}
+
+        return df_dict
+
+    def df_measurements_for_orders(self, *measurements_list, orders, include_total_concentration=False):
+        util.logging.debug(f'Calculating df values for measurements {tuple(map(str, measurements_list))}, include_total_concentration {include_total_concentration} and derivative and accuracy orders {orders}.')
+
+        measurements_collection = measurements.universal.data.MeasurementsCollection(*measurements_list)
+        points_dict = measurements_collection.points_dict
+
+        return self.df_points_for_orders(points_dict, orders,
+                                         include_total_concentration=include_total_concentration)
+
+    def dfu_all(self, direction, time_dim, tracers=None, include_total_concentration=False, accuracy_order=None):
+        # returns directional derivative DF * direction / |direction| which needs only one or two partial derivative runs
+        tracers = self.check_tracers(tracers)
+
+        util.logging.debug(f'Calculating all dfu values for direction {direction}, tracers {tracers} with time dimension {time_dim}, include_total_concentration {include_total_concentration} and accuracy_order {accuracy_order}.')
+
+        dfu = self._dfu(self._trajectory_load_function_for_all(time_dim=time_dim), direction,
+                        include_total_concentration=include_total_concentration,
+                        accuracy_order=accuracy_order, tracers=tracers)
+        return dfu
+
+    def dfu_points(self, direction, points, include_total_concentration=False, accuracy_order=None):
+        util.logging.debug(f'Calculating dfu values for direction {direction} at points {tuple(map(len, points))}, include_total_concentration {include_total_concentration} and accuracy_order {accuracy_order}.')
+
+        points, split_dict = self._merge_data_sets(points)
+        dfu = self._dfu(self._trajectory_load_function_for_points(points), direction,
+                        include_total_concentration=include_total_concentration,
+                        accuracy_order=accuracy_order)
+        dfu = self._split_data_sets(dfu, split_dict)
+
+        return dfu
+
+    def dfu_measurements(self, direction, *measurements_list, include_total_concentration=False, accuracy_order=None):
+        util.logging.debug(f'Calculating dfu values for direction {direction} and measurements {tuple(map(str, measurements_list))}, include_total_concentration {include_total_concentration} and accuracy_order {accuracy_order}.')
+
+        measurements_collection = measurements.universal.data.MeasurementsCollection(*measurements_list)
+        points_dict = measurements_collection.points_dict
+
+        return self.dfu_points(direction, points_dict,
+                               include_total_concentration=include_total_concentration,
+                               accuracy_order=accuracy_order)
+
+    def dfv_all(self, direction, time_dim, tracers=None, include_total_concentration=False, accuracy_order=None):
+        # returns directional derivative DF * direction
+        dfu = self.dfu_all(direction, time_dim, tracers=tracers, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+        return self._scale_values(dfu, np.linalg.norm(direction))
+
+    def dfv_points(self, direction, points, include_total_concentration=False, accuracy_order=None):
+        dfu = self.dfu_points(direction, points, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+        return self._scale_values(dfu, np.linalg.norm(direction))
+
+    def dfv_measurements(self, direction, *measurements_list, include_total_concentration=False, accuracy_order=None):
+        dfu = self.dfu_measurements(direction, *measurements_list, include_total_concentration=include_total_concentration, accuracy_order=accuracy_order)
+        return self._scale_values(dfu, np.linalg.norm(direction))
+
 
 # Cached versions
 
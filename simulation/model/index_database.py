@@ -0,0 +1,324 @@
+import hashlib
+import json
+import math
+import os
+import threading
+
+import numpy as np
+import scipy.spatial
+
+import simulation.model.constants
+
+import util.index_database.array_and_txt_file_based
+import util.index_database.general
+import util.index_database.petsc_file_based
+import util.io.fs
+import util.logging
+
+
+class Database(util.index_database.array_and_txt_file_based.Database):
+    # Array and txt file based index database which answers index and closest index queries with a kd-tree.
+    # The kd-tree is built over the values scaled by typical tolerance weights and uses the maximum norm.
+    # It only preselects candidates, the returned indices are always checked with the exact value difference of the database.
+
+    # spatial index
+
+    def _array_file_state(self):
+        try:
+            stat = os.stat(self.array_file)
+        except FileNotFoundError:
+            return None
+        else:
+            return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _spatial_index(self):
+        array_file = self.array_file
+        with self.array_db.locked_file.lock_object(exclusive=False):
+            file_state = self._array_file_state()
+            with _spatial_indices_lock:
+                spatial_index = _spatial_indices.get(array_file)
+            if spatial_index is None or spatial_index.file_state != file_state or spatial_index.database_tolerances != self._tolerances():
+                util.logging.debug(f'{self}: Building spatial index.')
+                try:
+                    values = self.array_db.locked_file.load()
+                except FileNotFoundError:
+                    values = np.empty((0, 0))
+                used_mask = np.all(np.logical_not(np.isnan(values)), axis=1)
+                indices = np.where(used_mask)[0].astype(np.int32)
+                spatial_index = _Spatial_Index(indices, values[used_mask], self.relative_tolerance, self.absolute_tolerance, file_state)
+                with _spatial_indices_lock:
+                    _spatial_indices[array_file] = spatial_index
+            return spatial_index
+
+    def _tolerances(self):
+        return (tuple(self.relative_tolerance), tuple(self.absolute_tolerance))
+
+    def value_differences(self, value, values):
+        # vectorized value_difference of value to each row of values
+        value = np.asanyarray(value)
+        values = np.asanyarray(values)
+        weights = np.maximum(np.minimum(np.abs(value), np.abs(values)) * self.relative_tolerance, self.absolute_tolerance)
+        return (np.abs(values - value) / weights).max(axis=1)
+
+    # access
+
+    def add_value(self, value):
+        with self.array_db.locked_file.lock_object(exclusive=True):
+            spatial_index = self._spatial_index()
+            index = super().add_value(value)
+            spatial_index.add(index, value, self._array_file_state())
+        return index
+
+    def closest_indices(self, value):
+        spatial_index = self._spatial_index()
+        with spatial_index.lock:
+            value_differences = self.value_differences(value, spatial_index.values)
+            sort = np.argsort(value_differences, kind='stable')
+            return spatial_index.indices[sort]
+
+    def closest_index(self, value):
+        util.logging.debug(f'{self}: Searching for index of value as close as possible to {value}.')
+        value = np.asanyarray(value, dtype=np.float64)
+        spatial_index = self._spatial_index()
+        with spatial_index.lock:
+            if len(spatial_index.indices) == 0:
+                util.logging.debug(f'{self}: No closest index found.')
+                return None
+
+            # the value difference of the nearest neighbor in the scaled maximum norm is an upper bound
+            nearest_index = spatial_index.nearest(value)
+            value_difference = self.value_differences(value, spatial_index.values[nearest_index][np.newaxis])[0]
+
+            # all values with smaller difference are within the corresponding ball in the scaled maximum norm
+            candidates = spatial_index.candidates(value, value_difference)
+            value_differences = self.value_differences(value, spatial_index.values[candidates])
+            closest_index = spatial_index.indices[candidates[np.argmin(value_differences)]]
+        util.logging.debug(f'{self}: Closest index is {closest_index}.')
+        return closest_index
+
+    def index(self, value):
+        util.logging.debug(f'{self}: Searching for index of value {value}.')
+        value = np.asanyarray(value, dtype=np.float64)
+        spatial_index = self._spatial_index()
+
+        # all equal values are within the ball with radius one in the database value difference
+        with spatial_index.lock:
+            candidates = spatial_index.candidates(value, 1)
+            if len(candidates) > 0:
+                value_differences = self.value_differences(value, spatial_index.values[candidates])
+                i = np.argmin(value_differences)
+                if value_differences[i] <= 1:
+                    index = spatial_index.indices[candidates[i]]
+                    util.logging.debug(f'{self}: Index for value {value} is {index}.')
+                    return index
+        util.logging.debug(f'{self}: No index found for value {value}.')
+        return None
+
+
+class _Spatial_Index():
+    # Spatial indices are shared by threads, so add and the queries of the database hold lock.
+
+    def __init__(self, indices, values, relative_tolerance, absolute_tolerance, file_state):
+        self.lock = threading.RLock()
+        self.relative_tolerance = np.asarray(relative_tolerance)
+        self.absolute_tolerance = np.asarray(absolute_tolerance)
+        self.database_tolerances = (tuple(relative_tolerance), tuple(absolute_tolerance))
+        self.file_state = file_state
+        self._build(np.asarray(indices), np.asarray(values, dtype=np.float64))
+
+    def _build(self, indices, values):
+        # sorted by index so that ties are resolved by the smallest index
+        sort = np.argsort(indices, kind='stable')
+        self.indices = indices[sort]
+        self.values = values[sort]
+        if len(self.values) > 0:
+            self.scale = np.maximum(np.median(np.abs(self.values), axis=0) * self.relative_tolerance, self.absolute_tolerance)
+            self.tree = scipy.spatial.cKDTree(self.values / self.scale)
+        else:
+            self.scale = None
+            self.tree = None
+        self.number_of_tree_values = len(self.values)
+
+    def add(self, index, value, file_state):
+        # added values are searched linearly until the tree is rebuilt
+        value = np.asarray(value, dtype=np.float64)
+        with self.lock:
+            if len(self.values) > 0:
+                self.indices = np.append(self.indices, np.int32(index))
+                self.values = np.concatenate([self.values, value[np.newaxis]])
+            else:
+                self.indices = np.array([index], dtype=np.int32)
+                self.values = value[np.newaxis]
+            number_of_added_values = len(self.values) - self.number_of_tree_values
+            if self.tree is None or number_of_added_values > max(simulation.model.constants.DATABASE_SPATIAL_INDEX_REBUILD_MIN, math.sqrt(self.number_of_tree_values)):
+                self._build(self.indices, self.values)
+            self.file_state = file_state
+
+    def _scale_factor(self, value):
+        # maximal weight of the value difference relative to the scale
+        # the value difference to value is at least the scaled maximum norm distance divided by this factor
+        return (np.maximum(np.abs(value) * self.relative_tolerance, self.absolute_tolerance) / self.scale).max()
+
+    def nearest(self, value):
+        if self.tree is None:
+            return 0
+        scaled_value = value / self.scale
+        distance, nearest = self.tree.query(scaled_value, k=1, p=np.inf)
+        added = np.arange(self.number_of_tree_values, len(self.values))
+        if len(added) > 0:
+            added_distances = np.abs(self.values[added] / self.scale - scaled_value).max(axis=1)
+            i = np.argmin(added_distances)
+            if added_distances[i] < distance:
+                nearest = added[i]
+        return nearest
+
+    def candidates(self, value, value_difference):
+        # positions of all values whose value difference to value could be smaller or equal to value_difference
+        if self.tree is None:
+            return np.arange(len(self.values))
+        radius = value_difference * self._scale_factor(value) * (1 + 10**-8)
+        scaled_value = value / self.scale
+        candidates = self.tree.query_ball_point(scaled_value, radius, p=np.inf)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        added = np.arange(self.number_of_tree_values, len(self.values), dtype=np.int64)
+        if len(added) > 0:
+            added_distances = np.abs(self.values[added] / self.scale - scaled_value).max(axis=1)
+            candidates = np.concatenate([candidates, added[added_distances <= radius]])
+        return np.sort(candidates)
+
+
+_spatial_indices = {}
+_spatial_indices_lock = threading.Lock()
+
+
+class Vector_Database(util.index_database.petsc_file_based.Database):
+    # PETSc file based index database which stores a fingerprint for each value.
+    # The fingerprint contains a hash of the value and summary statistics for each value file.
+    # The statistics give lower bounds for the value difference, so that most values never have to be loaded.
+
+    @staticmethod
+    def fingerprint(value):
+        value = np.atleast_2d(np.asarray(value, dtype=np.float64))
+        value_hash = hashlib.sha256()
+        for value_row in value:
+            value_hash.update(np.ascontiguousarray(value_row).tobytes())
+        value_abs = np.abs(value)
+        return {'hash': value_hash.hexdigest(),
+                'len': value.shape[1],
+                'sum': value.sum(axis=1).tolist(),
+                'min': value.min(axis=1).tolist(),
+                'max': value.max(axis=1).tolist(),
+                'norm_1': value_abs.sum(axis=1).tolist(),
+                'norm_inf': value_abs.max(axis=1).tolist()}
+
+    def _fingerprint_file(self, index):
+        return os.path.join(self.value_dir.format(index), simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_FINGERPRINT_FILENAME)
+
+    def save_fingerprint(self, index, fingerprint=None, overwrite=False):
+        fingerprint_file = self._fingerprint_file(index)
+        if overwrite or not os.path.exists(fingerprint_file):
+            if fingerprint is None:
+                fingerprint = self.fingerprint(self.get_value(index))
+            util.logging.debug(f'{self}: Saving fingerprint for index {index} to {fingerprint_file}.')
+            tmp_file = f'{fingerprint_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_file, 'w') as file:
+                json.dump(fingerprint, file)
+            os.replace(tmp_file, fingerprint_file)
+            util.io.fs.make_read_only(fingerprint_file)
+        return fingerprint
+
+    def get_fingerprint(self, index):
+        fingerprint_file = self._fingerprint_file(index)
+        try:
+            stat = os.stat(fingerprint_file)
+        except FileNotFoundError:
+            # values stored before fingerprints were introduced
+            fingerprint = self.fingerprint(self.get_value(index))
+            try:
+                self.save_fingerprint(index, fingerprint=fingerprint)
+            except OSError as e:
+                util.logging.warning(f'{self}: Fingerprint for index {index} could not be saved: {e}')
+            return fingerprint
+        else:
+            file_state = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            with _fingerprints_lock:
+                try:
+                    cached_file_state, fingerprint = _fingerprints[fingerprint_file]
+                except KeyError:
+                    cached_file_state = None
+            if cached_file_state != file_state:
+                with open(fingerprint_file) as file:
+                    fingerprint = json.load(file)
+                with _fingerprints_lock:
+                    _fingerprints[fingerprint_file] = (file_state, fingerprint)
+            return fingerprint
+
+    def value_difference_lower_bound(self, fingerprint_1, fingerprint_2):
+        # the value differences of all entries are bounded by the maximal weight, so are the differences of the statistics
+        if fingerprint_1['hash'] == fingerprint_2['hash']:
+            return 0
+        if fingerprint_1['len'] != fingerprint_2['len'] or len(fingerprint_1['sum']) != len(fingerprint_2['sum']):
+            return float('inf')
+        relative_tolerance = np.max(self.relative_tolerance)
+        absolute_tolerance = np.max(self.absolute_tolerance)
+        n = fingerprint_1['len']
+        rounding_error = simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_FINGERPRINT_ROUNDING_ERROR
+
+        norm_1 = np.minimum(fingerprint_1['norm_1'], fingerprint_2['norm_1'])
+        norm_inf = np.minimum(fingerprint_1['norm_inf'], fingerprint_2['norm_inf'])
+        sum_weight = norm_1 * relative_tolerance + n * absolute_tolerance
+        max_weight = norm_inf * relative_tolerance + absolute_tolerance
+        sum_rounding_error = rounding_error * (np.asarray(fingerprint_1['norm_1']) + np.asarray(fingerprint_2['norm_1']))
+
+        lower_bounds = []
+        for key, weight, error in (('sum', sum_weight, sum_rounding_error), ('norm_1', sum_weight, sum_rounding_error), ('min', max_weight, 0), ('max', max_weight, 0), ('norm_inf', max_weight, 0)):
+            difference = np.maximum(np.abs(np.asarray(fingerprint_1[key]) - np.asarray(fingerprint_2[key])) - error, 0)
+            lower_bounds.append((difference / weight).max())
+        return max(lower_bounds)
+
+    # access
+
+    def set_value(self, index, value, overwrite=False):
+        super().set_value(index, value, overwrite=overwrite)
+        self.save_fingerprint(index, fingerprint=self.fingerprint(value), overwrite=True)
+
+    def _closest_index(self, value, max_value_difference=float('inf')):
+        # branch and bound over the values ordered by the lower bounds of their value differences
+        fingerprint = self.fingerprint(value)
+        lower_bounds = []
+        for index in sorted(self.used_indices()):
+            try:
+                index_fingerprint = self.get_fingerprint(index)
+            except util.index_database.general.DatabaseIndexError as e:
+                util.logging.warning(f'{self}: Could not read the value file for index {index}: {e}')
+            else:
+                lower_bounds.append((self.value_difference_lower_bound(fingerprint, index_fingerprint), index))
+        lower_bounds.sort()
+
+        closest_index = None
+        closest_value_difference = max_value_difference
+        number_of_loaded_values = 0
+        for lower_bound, index in lower_bounds:
+            if lower_bound > closest_value_difference:
+                break
+            value_difference = self.value_difference(value, self.get_value(index))
+            number_of_loaded_values += 1
+            if value_difference < closest_value_difference or (value_difference == closest_value_difference and (closest_index is None or index < closest_index)):
+                closest_index = index
+                closest_value_difference = value_difference
+        util.logging.debug(f'{self}: Loaded {number_of_loaded_values} of {len(lower_bounds)} values to find closest index {closest_index}.')
+        return closest_index
+
+    def closest_index(self, value):
+        util.logging.debug(f'{self}: Searching for index of value as close as possible to {value}.')
+        return self._closest_index(value)
+
+    def index(self, value):
+        util.logging.debug(f'{self}: Searching for index of value {value}.')
+        index = self._closest_index(value, max_value_difference=1)
+        util.logging.debug(f'{self}: Index for value {value} is {index}.')
+        return index
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
@@ -0,0 +1,56 @@
+import os
+
+import simulation
+import simulation.model.constants
+import simulation.model.index_database
+
+import util.logging
+
+
+def vector_concentrations_db(model_name):
+    model_dir = os.path.join(simulation.model.constants.DATABASE_OUTPUT_DIR, simulation.model.constants.DATABASE_MODEL_DIRNAME.format(model_name))
+    base_dir = os.path.join(model_dir, simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_DIRNAME)
+    if not os.path.exists(base_dir):
+        return None
+    value_dir = os.path.join(base_dir, simulation.model.constants.DATABASE_CONCENTRATIONS_DIRNAME)
+    tracers = simulation.model.constants.MODEL_TRACER[model_name]
+    concentration_filenames = [simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_FILENAME.format(tracer=tracer) for tracer in tracers]
+    return simulation.model.index_database.Vector_Database(value_dir, concentration_filenames, value_reliable_decimal_places=simulation.model.constants.DATABASE_VECTOR_CONCENTRATIONS_RELIABLE_DECIMAL_PLACES)
+
+
+def index_vector_concentrations(model_names=None, overwrite=False):
+    if model_names is None:
+        model_names = simulation.model.constants.MODEL_NAMES
+
+    for model_name in model_names:
+        concentrations_db = vector_concentrations_db(model_name)
+        if concentrations_db is not None:
+            indices = sorted(concentrations_db.used_indices())
+            util.logging.info(f'Saving fingerprints for {len(indices)} vector concentrations of model {model_name}.')
+            for index in indices:
+                concentrations_db.save_fingerprint(index, overwrite=overwrite)
+
+
+# *** main function for script call *** #
+
+def _main():
+
+    # parse arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Saving fingerprints for the vector initial concentrations in the database.')
+
+    parser.add_argument('-m', '--model_names', default=None, choices=simulation.model.constants.MODEL_NAMES, nargs='+', help='The models to index. Default: all models.')
+    parser.add_argument('-o', '--overwrite', action='store_true', help='Recalculate also existing fingerprints.')
+    parser.add_argument('-d', '--debug_level', choices=util.logging.LEVELS, default='INFO', help='Print debug infos low to passed level.')
+    parser.add_argument('--version', action='version', version='%(prog)s {}'.format(simulation.__version__))
+
+    args = parser.parse_args()
+
+    # call function
+    with util.logging.Logger(level=args.debug_level):
+        index_vector_concentrations(model_names=args.model_names, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    _main()
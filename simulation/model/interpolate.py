@@ -0,0 +1,385 @@
+import collections
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+import scipy.sparse
+import scipy.spatial
+
+import simulation.model.constants
+import simulation.model.data
+
+import util.cache.memory
+import util.math.interpolate
+import util.logging
+
+
+# keyed cache
+
+class Keyed_Cache:
+
+    def __init__(self, cache_dir, filename_pattern, load_function, save_function, memory_maxsize=None):
+        # cache with bounded in memory LRU and atomically written files, keys have to be usable as filenames
+        if memory_maxsize is None:
+            memory_maxsize = simulation.model.constants.MODEL_INTERPOLATOR_CACHE_MEMORY_MAXSIZE
+        self.cache_dir = cache_dir
+        self.filename_pattern = filename_pattern
+        self.load_function = load_function
+        self.save_function = save_function
+        self.memory_maxsize = memory_maxsize
+        self._memory_cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def file(self, key):
+        return os.path.join(self.cache_dir, self.filename_pattern.format(key=key))
+
+    def _add_to_memory(self, key, value):
+        with self._lock:
+            self._memory_cache[key] = value
+            self._memory_cache.move_to_end(key)
+            while len(self._memory_cache) > self.memory_maxsize:
+                self._memory_cache.popitem(last=False)
+
+    def get(self, key, calculate_function, use_file=True):
+        # try to get value from memory
+        with self._lock:
+            try:
+                value = self._memory_cache[key]
+            except KeyError:
+                pass
+            else:
+                self._memory_cache.move_to_end(key)
+                util.logging.debug(f'Returning value for key {key} from memory.')
+                return value
+
+        # try to load value from file
+        file = self.file(key)
+        if use_file:
+            try:
+                value = self.load_function(file)
+            except FileNotFoundError:
+                value = None
+            else:
+                util.logging.debug(f'Returning value for key {key} loaded from {file}.')
+
+        # calculate and save value
+        if not use_file or value is None:
+            value = calculate_function()
+            if use_file:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_file = f'{file}.{os.getpid()}.{threading.get_ident()}.tmp'
+                try:
+                    self.save_function(tmp_file, value)
+                    os.replace(tmp_file, file)
+                except OSError as e:
+                    util.logging.warning(f'Value for key {key} could not be saved to {file}: {e}')
+                    try:
+                        os.remove(tmp_file)
+                    except OSError:
+                        pass
+                else:
+                    util.logging.debug(f'Value for key {key} saved to {file}.')
+
+        self._add_to_memory(key, value)
+        return value
+
+
+def _hash(*values):
+    key = hashlib.sha256()
+    for value in values:
+        if isinstance(value, np.ndarray):
+            key.update(np.ascontiguousarray(value).tobytes())
+        else:
+            key.update(repr(value).encode())
+    return key.hexdigest()
+
+
+# nearest water boxes
+
+@util.cache.memory.decorator()
+def _water_boxes_tree():
+    # centers of water boxes as map indices, shifted copies for periodicity in x
+    x_dim = simulation.model.constants.METOS_X_DIM
+    water_boxes = np.array(simulation.model.data.metos_index_map(), dtype=np.float64).swapaxes(0, 1)
+    water_boxes = np.concatenate([water_boxes + np.array([x_shift, 0, 0]) for x_shift in (0, -x_dim, x_dim)])
+    return scipy.spatial.cKDTree(water_boxes)
+
+
+def nearest_water_boxes(space_points, number_of_boxes=1):
+    # returns metos vector indices of the nearest water boxes of points given as (x, y, z) float map indices
+    space_points = np.array(space_points, dtype=np.float64)
+    assert space_points.ndim == 2 and space_points.shape[1] == 3
+    space_points[:, 0] %= simulation.model.constants.METOS_X_DIM
+
+    util.logging.debug(f'Searching {number_of_boxes} nearest water boxes for {len(space_points)} points.')
+    distances, indices = _water_boxes_tree().query(space_points, k=number_of_boxes)
+    indices = indices % simulation.model.constants.METOS_VECTOR_LEN
+    return indices
+
+
+# needed trajectory values
+
+def trajectory_indices_for_points(interpolation_points, time_dim, time_margin=None, number_of_boxes=None):
+    # returns unique pairs of time indices and metos vector indices of trajectory values near the points given as (t, x, y, z) float map indices
+    if time_margin is None:
+        time_margin = simulation.model.constants.MODEL_TRAJECTORY_SPARSE_LOADING_TIME_MARGIN
+    if number_of_boxes is None:
+        number_of_boxes = simulation.model.constants.MODEL_TRAJECTORY_SPARSE_LOADING_NUMBER_OF_BOXES
+
+    interpolation_points = np.asanyarray(interpolation_points)
+    assert interpolation_points.ndim == 2 and interpolation_points.shape[1] == 4
+
+    # time indices around each point (periodic)
+    t = interpolation_points[:, 0] * (time_dim / simulation.model.constants.METOS_T_DIM)
+    time_offsets = np.arange(- time_margin, time_margin + 2)
+    time_indices = (np.floor(t).astype(np.int64)[:, np.newaxis] + time_offsets) % time_dim
+
+    # nearest water boxes of each point
+    metos_indices = nearest_water_boxes(interpolation_points[:, 1:], number_of_boxes=number_of_boxes)
+    metos_indices = metos_indices.reshape(len(interpolation_points), -1)
+
+    # unique combinations
+    flat_indices = time_indices[:, :, np.newaxis] * simulation.model.constants.METOS_VECTOR_LEN + metos_indices[:, np.newaxis, :]
+    flat_indices = np.unique(flat_indices)
+    time_indices, metos_indices = np.divmod(flat_indices, simulation.model.constants.METOS_VECTOR_LEN)
+
+    util.logging.debug(f'{len(flat_indices)} trajectory values of {time_dim * simulation.model.constants.METOS_VECTOR_LEN} are needed for {len(interpolation_points)} points.')
+    return time_indices, metos_indices
+
+
+# interpolation operator
+
+class Interpolation_Operator:
+
+    def __init__(self, matrix, time_indices, metos_indices):
+        # sparse matrix mapping the trajectory values at the pairs of time and metos vector indices to the interpolation points
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+        self.time_indices = np.asarray(time_indices, dtype=np.int64)
+        self.metos_indices = np.asarray(metos_indices, dtype=np.int64)
+        assert self.matrix.shape[1] == len(self.time_indices) == len(self.metos_indices)
+
+    @property
+    def number_of_points(self):
+        return self.matrix.shape[0]
+
+    def apply(self, values):
+        # values have shape (number of used trajectory values, ...)
+        values = np.asanyarray(values)
+        assert values.shape[0] == self.matrix.shape[1]
+        if values.ndim <= 2:
+            return self.matrix @ values
+        else:
+            interpolated_values = self.matrix @ values.reshape(values.shape[0], -1)
+            return interpolated_values.reshape((self.number_of_points,) + values.shape[1:])
+
+    def save(self, file):
+        with open(file, mode='wb') as file_object:
+            np.savez(file_object, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr, shape=self.matrix.shape, time_indices=self.time_indices, metos_indices=self.metos_indices)
+        util.logging.debug(f'Interpolation operator saved to {file}.')
+
+    @staticmethod
+    def load(file):
+        with np.load(file) as loaded:
+            matrix = scipy.sparse.csr_matrix((loaded['data'], loaded['indices'], loaded['indptr']), shape=tuple(loaded['shape']))
+            operator = Interpolation_Operator(matrix, loaded['time_indices'], loaded['metos_indices'])
+        util.logging.debug(f'Interpolation operator loaded from {file}.')
+        return operator
+
+
+def _operator_from_weights(rows, time_indices, metos_indices, weights, number_of_points):
+    # one column for each used pair of time index and metos vector index
+    flat_indices = time_indices * simulation.model.constants.METOS_VECTOR_LEN + metos_indices
+    flat_indices, columns = np.unique(flat_indices, return_inverse=True)
+    matrix = scipy.sparse.csr_matrix((weights, (rows, columns.reshape(-1))), shape=(number_of_points, len(flat_indices)))
+    time_indices, metos_indices = np.divmod(flat_indices, simulation.model.constants.METOS_VECTOR_LEN)
+    return Interpolation_Operator(matrix, time_indices, metos_indices)
+
+
+# grid interpolator
+
+class Grid_Interpolator:
+
+    METHODS = ('nearest', 'linear')
+
+    def __init__(self, time_dim, method='linear'):
+        # interpolator on the regular grid of the model with periodic time and longitude axes and values only in water boxes
+        if method not in self.METHODS:
+            raise ValueError(f'Method has to be in {self.METHODS}, but its value is {method}.')
+        self.time_dim = time_dim
+        self.method = method
+
+    def __str__(self):
+        return f'{self.__class__.__name__}(time_dim={self.time_dim}, method={self.method})'
+
+    def _time_indices_and_weights(self, t):
+        # time index of values is left side of time step, periodic
+        t = t * (self.time_dim / simulation.model.constants.METOS_T_DIM)
+        if self.method == 'nearest':
+            time_indices = np.floor(t + 0.5).astype(np.int64)[:, np.newaxis]
+            time_weights = np.ones(time_indices.shape)
+        else:
+            t_floor = np.floor(t)
+            t_fraction = (t - t_floor)[:, np.newaxis]
+            time_indices = t_floor.astype(np.int64)[:, np.newaxis] + np.arange(2)
+            time_weights = np.concatenate([1 - t_fraction, t_fraction], axis=1)
+        time_indices %= self.time_dim
+        return time_indices, time_weights
+
+    def _space_indices_and_weights(self, space_points):
+        METOS_LSM = simulation.model.constants.METOS_LSM
+        number_of_points = len(space_points)
+
+        # nearest water box
+        if self.method == 'nearest':
+            metos_indices = nearest_water_boxes(space_points, number_of_boxes=1)[:, np.newaxis]
+            space_weights = np.ones(metos_indices.shape)
+
+        # multilinear weights of surrounding boxes, periodic in x and bounded in y and z
+        else:
+            corner_indices = []
+            corner_weights = []
+            for i, (dim, periodic) in enumerate(((METOS_LSM.x_dim, True), (METOS_LSM.y_dim, False), (METOS_LSM.z_dim, False))):
+                p = space_points[:, i]
+                if not periodic:
+                    p = np.clip(p, 0, dim - 1)
+                p_floor = np.floor(p)
+                if not periodic:
+                    p_floor = np.minimum(p_floor, dim - 2)
+                p_fraction = p - p_floor
+                indices = p_floor.astype(np.int64)[:, np.newaxis] + np.arange(2)
+                if periodic:
+                    indices %= dim
+                corner_indices.append(indices)
+                corner_weights.append(np.stack([1 - p_fraction, p_fraction], axis=1))
+
+            # combine to 8 corners
+            x_indices, y_indices, z_indices = (a.reshape(number_of_points, -1) for a in np.broadcast_arrays(corner_indices[0][:, :, np.newaxis, np.newaxis], corner_indices[1][:, np.newaxis, :, np.newaxis], corner_indices[2][:, np.newaxis, np.newaxis, :]))
+            space_weights = (corner_weights[0][:, :, np.newaxis, np.newaxis] * corner_weights[1][:, np.newaxis, :, np.newaxis] * corner_weights[2][:, np.newaxis, np.newaxis, :]).reshape(number_of_points, -1)
+            metos_indices = simulation.model.data.metos_inverse_index_map()[x_indices, y_indices, z_indices]
+
+            # use only water boxes and normalize weights
+            water_mask = metos_indices >= 0
+            space_weights = np.where(water_mask, space_weights, 0)
+            space_weights_sum = space_weights.sum(axis=1)
+            has_water_mask = space_weights_sum > 0
+            space_weights[has_water_mask] /= space_weights_sum[has_water_mask, np.newaxis]
+            metos_indices = np.where(water_mask, metos_indices, 0)
+
+            # use nearest water box if no surrounding box is water
+            no_water_indices = np.where(~ has_water_mask)[0]
+            if len(no_water_indices) > 0:
+                util.logging.debug(f'Using nearest water box for {len(no_water_indices)} points without surrounding water box.')
+                metos_indices[no_water_indices, 0] = nearest_water_boxes(space_points[no_water_indices], number_of_boxes=1)
+                space_weights[no_water_indices, 0] = 1
+
+        return metos_indices, space_weights
+
+    def operator(self, interpolation_points):
+        # sparse operator for points given as (t, x, y, z) float map indices
+        interpolation_points = np.asanyarray(interpolation_points, dtype=np.float64)
+        assert interpolation_points.ndim == 2 and interpolation_points.shape[1] == 4
+        number_of_points = len(interpolation_points)
+        util.logging.debug(f'Calculating {self.method} grid interpolation operator for {number_of_points} points and time dim {self.time_dim}.')
+
+        time_indices, time_weights = self._time_indices_and_weights(interpolation_points[:, 0])
+        metos_indices, space_weights = self._space_indices_and_weights(interpolation_points[:, 1:])
+
+        # combine time and space
+        shape = (number_of_points, time_indices.shape[1], metos_indices.shape[1])
+        rows = np.broadcast_to(np.arange(number_of_points)[:, np.newaxis, np.newaxis], shape).reshape(-1)
+        time_indices = np.broadcast_to(time_indices[:, :, np.newaxis], shape).reshape(-1)
+        metos_indices = np.broadcast_to(metos_indices[:, np.newaxis, :], shape).reshape(-1)
+        weights = (time_weights[:, :, np.newaxis] * space_weights[:, np.newaxis, :]).reshape(-1)
+
+        # remove zero weights
+        mask = weights != 0
+        return _operator_from_weights(rows[mask], time_indices[mask], metos_indices[mask], weights[mask], number_of_points)
+
+    def interpolate(self, data, interpolation_points):
+        # data has shape (time_dim, METOS_VECTOR_LEN, ...)
+        data = np.asanyarray(data)
+        assert data.shape[:2] == (self.time_dim, simulation.model.constants.METOS_VECTOR_LEN)
+        operator = self.operator(interpolation_points)
+        return operator.apply(data[operator.time_indices, operator.metos_indices])
+
+
+# interpolation operator for engine
+
+def _grid_interpolator(time_dim, engine=None):
+    if engine is None:
+        engine = simulation.model.constants.MODEL_INTERPOLATOR_ENGINE
+    if engine == 'grid':
+        return Grid_Interpolator(time_dim, method='linear')
+    elif engine == 'scattered':
+        # nearest grid interpolation is equal to scattered interpolation without linear interpolators
+        if simulation.model.constants.MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR != 0:
+            raise ValueError('Scattered interpolation with linear interpolators can not be represented as interpolation operator.')
+        return Grid_Interpolator(time_dim, method='nearest')
+    else:
+        raise ValueError(f'Unknown interpolator engine {engine}.')
+
+
+_interpolation_operator_cache = Keyed_Cache(simulation.model.constants.MODEL_INTERPOLATION_OPERATOR_DIR, simulation.model.constants.MODEL_INTERPOLATION_OPERATOR_FILENAME, Interpolation_Operator.load, lambda file, operator: operator.save(file))
+
+
+def interpolation_operator_key(interpolation_points, time_dim, engine=None):
+    interpolator = _grid_interpolator(time_dim, engine=engine)
+    interpolation_points = np.asarray(interpolation_points, dtype=np.float64)
+    return _hash(str(simulation.model.constants.METOS_LSM), str(interpolator), interpolation_points.shape, interpolation_points)
+
+
+def interpolation_operator(interpolation_points, time_dim, use_cache=True, engine=None):
+    key = interpolation_operator_key(interpolation_points, time_dim, engine=engine)
+
+    def calculate_function():
+        return _grid_interpolator(time_dim, engine=engine).operator(interpolation_points)
+
+    return _interpolation_operator_cache.get(key, calculate_function, use_file=use_cache)
+
+
+# scattered interpolator
+
+def _load_pickle(file):
+    with open(file, mode='rb') as file_object:
+        return pickle.load(file_object)
+
+
+def _save_pickle(file, value):
+    with open(file, mode='wb') as file_object:
+        pickle.dump(value, file_object, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+_scattered_interpolator_cache = Keyed_Cache(simulation.model.constants.MODEL_INTERPOLATOR_CACHE_DIR, simulation.model.constants.MODEL_INTERPOLATOR_CACHE_FILENAME, _load_pickle, _save_pickle)
+_scattered_interpolator_lock = threading.Lock()
+
+
+def scattered_interpolator_key(time_dim, data_points_key=None):
+    # data points key describes used data points, None means all data points
+    from .constants import METOS_LSM, METOS_DIM, MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR
+    return _hash(str(METOS_LSM), time_dim, METOS_DIM, MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR, data_points_key)
+
+
+def interpolate_scattered(data, interpolation_points, time_dim, data_points_key=None, use_cache=False):
+    from .constants import METOS_DIM, MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR
+
+    data_points = data[:, :-1]
+    data_values = data[:, -1]
+
+    # get cached or create new interpolator
+    def calculate_function():
+        util.logging.debug('Creating new interpolator.')
+        interpolator = util.math.interpolate.Periodic_Interpolator(data_points=data_points, data_values=data_values, point_range_size=METOS_DIM, scaling_values=(METOS_DIM[1] / METOS_DIM[0], None, None, None), wrap_around_amount=MODEL_INTERPOLATOR_AMOUNT_OF_WRAP_AROUND, number_of_linear_interpolators=MODEL_INTERPOLATOR_NUMBER_OF_LINEAR_INTERPOLATOR, single_overlapping_amount_linear_interpolators=MODEL_INTERPOLATOR_SINGLE_OVERLAPPING_AMOUNT_OF_LINEAR_INTERPOLATOR)
+        return interpolator
+
+    key = scattered_interpolator_key(time_dim, data_points_key=data_points_key)
+    interpolator = _scattered_interpolator_cache.get(key, calculate_function, use_file=use_cache)
+
+    # interpolate (data values of the shared interpolator are changed)
+    with _scattered_interpolator_lock:
+        interpolator.data_values = data_values
+        interpolated_values = interpolator.interpolate(interpolation_points)
+
+    assert not np.any(np.isnan(interpolated_values))
+    return interpolated_values
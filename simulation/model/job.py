@@ -1,11 +1,13 @@
 import os
 import time
 import re
+import threading
 import warnings
 
 import numpy as np
 
 import simulation.model.constants
+import simulation.model.data
 
 import util.batch.universal.system
 import util.io.fs
@@ -27,6 +29,33 @@ class Metos3D_Job(util.batch.universal.system.Job):
 
     # run options
 
+    SPINUP_LINE_SEARCH_STR = 'Spinup Function norm'
+
+    @staticmethod
+    def _last_line_containing(file, search_str, block_size=2**16):
+        # read file backwards in blocks until a complete line containing search_str is found
+        search_bytes = search_str.encode()
+        with open(file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            tail = b''
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                tail = f.read(read_size) + tail
+                lines = tail.split(b'\n')
+                # first line may be incomplete if not at file start
+                if position > 0:
+                    tail = lines[0]
+                    lines = lines[1:]
+                for line in reversed(lines):
+                    if search_bytes in line:
+                        return line.decode()
+                if position == 0:
+                    break
+        return None
+
     @property
     def last_spinup_line(self):
         self.wait_until_finished()
@@ -34,12 +63,8 @@ class Metos3D_Job(util.batch.universal.system.Job):
         # 9.704s 0010 Spinup Function norm 2.919666257647e+00
         # 9.704s 0010 Spinup Function norm 2.919666257647e+00 7.012035082243e+06
 
-        search_str = 'Spinup Function norm'
-        last_spinup_line = None
-        output = self.output
-        for line in output.splitlines():
-            if search_str in line:
-                last_spinup_line = line
+        search_str = self.SPINUP_LINE_SEARCH_STR
+        last_spinup_line = self._last_line_containing(self.output_file, search_str)
 
         if last_spinup_line is None:
             error_message = 'In job output is no "{}" line.'.format(search_str)
@@ -47,6 +72,45 @@ class Metos3D_Job(util.batch.universal.system.Job):
 
         return last_spinup_line
 
+    @property
+    def convergence_history_file(self):
+        return os.path.join(self.output_dir, simulation.model.constants.JOB_CONVERGENCE_HISTORY_FILENAME)
+
+    @property
+    def convergence_history(self):
+        # array with rows (year, spinup function norm), year is the number of finished spinup years as in last_year
+        self.wait_until_finished()
+        output_file = self.output_file
+        history_file = self.convergence_history_file
+
+        # load cached history if newer than output
+        try:
+            history_is_valid = os.stat(history_file).st_mtime_ns >= os.stat(output_file).st_mtime_ns
+        except FileNotFoundError:
+            history_is_valid = False
+        if history_is_valid:
+            return np.load(history_file)
+
+        # parse output
+        util.logging.debug(f'Parsing convergence history from {output_file}.')
+        search_str = self.SPINUP_LINE_SEARCH_STR
+        history = []
+        with open(output_file, 'r') as f:
+            for line in f:
+                if search_str in line:
+                    line_splitted = line.split()
+                    history.append((int(line_splitted[1]) + 1, float(line_splitted[5])))
+        history = np.array(history, dtype=np.float64).reshape(-1, 2)
+
+        # cache history
+        try:
+            tmp_file = f'{history_file}.{os.getpid()}.tmp.npy'
+            np.save(tmp_file, history)
+            os.replace(tmp_file, history_file)
+        except OSError as e:
+            util.logging.debug(f'Convergence history could not be saved to {history_file}: {e}')
+        return history
+
     @property
     def last_year(self):
         last_spinup_line = self.last_spinup_line
@@ -190,21 +254,33 @@ class Metos3D_Job(util.batch.universal.system.Job):
             return False
 
         # check if output file is completely written
+        return self.is_output_complete()
+
+    def is_output_complete(self):
+        # check without waiting, remember when the incomplete output was last changed
         job_output = self.output
         if 'Metos3DFinal' in job_output:
+            self._incomplete_output = None
             return True
+
+        now = time.monotonic()
+        try:
+            last_output, last_change_time = self._incomplete_output
+        except (AttributeError, TypeError):
+            last_output = None
+        if job_output != last_output:
+            self._incomplete_output = (job_output, now)
+            return False
+        elif now - last_change_time < simulation.model.constants.JOB_OUTPUT_COMPLETE_TIMEOUT_SECONDS:
+            return False
         else:
-            time.sleep(30)
-            if self.output != job_output:
-                return False
-            else:
-                raise util.batch.universal.system.JobError(self, 'The job output file is not completely written!', job_output)
+            raise util.batch.universal.system.JobError(self, 'The job output file is not completely written!', job_output)
 
     # write job file
 
-    def write_job_file(self, model_name, model_parameters, years, tolerance=None, time_step=1, initial_constant_concentrations=None, tracer_input_files=None, total_concentration_factor=1, write_trajectory=False, job_options=None):
+    def write_job_file(self, model_name, model_parameters, years, tolerance=None, time_step=1, initial_constant_concentrations=None, tracer_input_files=None, total_concentration_factor=1, write_trajectory=False, write_annual_states=0, job_options=None):
 
-        util.logging.debug('Initialising job with model {}, parameters {},  years {}, tolerance {}, time step {}, initial_constant_concentrations {}, tracer_input_files {}, total concentration factor {} and job_options {}.'.format(model_name, model_parameters, years, tolerance, time_step, initial_constant_concentrations, tracer_input_files, total_concentration_factor, job_options))
+        util.logging.debug('Initialising job with model {}, parameters {},  years {}, tolerance {}, time step {}, initial_constant_concentrations {}, tracer_input_files {}, total concentration factor {}, write annual states {} and job_options {}.'.format(model_name, model_parameters, years, tolerance, time_step, initial_constant_concentrations, tracer_input_files, total_concentration_factor, write_annual_states, job_options))
 
         # check input
         if time_step not in simulation.model.constants.METOS_TIME_STEPS:
@@ -220,6 +296,10 @@ class Metos3D_Job(util.batch.universal.system.Job):
 
         if initial_constant_concentrations is not None and tracer_input_files is not None:
             raise ValueError('You can not set the initial concentration and the tracer input files simultaneously.')
+        if write_annual_states < 0:
+            raise ValueError(f'Write_annual_states must be greater or equal 0, but it is {write_annual_states} .')
+        if write_trajectory and write_annual_states > 0:
+            raise ValueError('You can not write the trajectory and annual states simultaneously.')
 
         number_of_tracers = len(simulation.model.constants.MODEL_TRACER[model_name])
         if initial_constant_concentrations is not None:
@@ -307,6 +387,7 @@ class Metos3D_Job(util.batch.universal.system.Job):
         opt['/metos3d/data_dir'] = simulation.model.constants.METOS_DATA_DIR_ENV
         opt['/metos3d/sim_file'] = simulation.model.constants.METOS_SIM_FILE_ENV.format(model_name=model_name, METOS3D_DIR='{METOS3D_DIR}')
         opt['/metos3d/write_trajectory'] = write_trajectory
+        opt['/metos3d/write_annual_states'] = write_annual_states
 
         if not write_trajectory:
             opt['/metos3d/tracer_output_dir'] = output_dir_not_expanded
@@ -345,7 +426,7 @@ class Metos3D_Job(util.batch.universal.system.Job):
                         os.remove(tracer_input_file_metos3d)
                         os.symlink(tracer_input_file_base_abs, tracer_input_file_metos3d)
                 else:
-                    tracer_input = util.petsc.universal.load_petsc_vec_to_numpy_array(tracer_input_file_base)
+                    tracer_input = simulation.model.data.load_petsc_vec_to_memmap(tracer_input_file_base)
                     tracer_input = tracer_input * total_concentration_factor
                     util.petsc.universal.save_numpy_array_to_petsc_vec(tracer_input_file_metos3d, tracer_input)
                 assert os.path.exists(tracer_input_file_metos3d)
@@ -444,6 +525,9 @@ class Metos3D_Job(util.batch.universal.system.Job):
         if opt['/metos3d/write_trajectory']:
             metos3d_options.append('-Metos3DSpinupMonitorFileFormatPrefix   sp$0004d-,ts$0004d-')
             metos3d_options.append('-Metos3DSpinupMonitorModuloStep         1,1')
+        elif opt['/metos3d/write_annual_states'] > 0:
+            metos3d_options.append('-Metos3DSpinupMonitorFileFormatPrefix   sp$0004d-')
+            metos3d_options.append('-Metos3DSpinupMonitorModuloStep         {:d}'.format(opt['/metos3d/write_annual_states']))
         metos3d_options.append(linesep)
 
         metos3d_options = linesep.join(metos3d_options)
@@ -551,3 +635,47 @@ class Metos3D_Job(util.batch.universal.system.Job):
         # tracer output files
         tracer_output_files = tuple(map(lambda filename: os.path.join(options['/metos3d/tracer_output_dir'], filename), options['/metos3d/tracer_output_filenames']))
         tuple(map(lambda file: check_if_file_exists(file, should_exists=is_finished, should_be_in_output_dir=True), tracer_output_files))
+
+
+# cached job properties
+
+_cached_job_properties = {}
+_cached_job_properties_lock = threading.Lock()
+
+
+def _job_options_file_state(run_dir):
+    options_file = os.path.join(os.path.expandvars(run_dir), simulation.model.constants.JOB_OPTIONS_FILENAME)
+    try:
+        stat = os.stat(options_file)
+    except FileNotFoundError:
+        return None
+    else:
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def cached_job_properties(run_dir, *property_names):
+    # returns the properties of the job in run_dir without opening its job options file again as long as it is not modified
+    # only properties which are determined by the job options should be requested
+    key = os.path.realpath(os.path.expandvars(run_dir))
+    file_state = _job_options_file_state(run_dir)
+
+    with _cached_job_properties_lock:
+        try:
+            cached_file_state, properties = _cached_job_properties[key]
+        except KeyError:
+            cached_file_state = None
+        if file_state is None or cached_file_state != file_state:
+            properties = {}
+
+    missing_property_names = [name for name in property_names if name not in properties]
+    if file_state is None or cached_file_state != file_state or len(missing_property_names) > 0:
+        with Metos3D_Job(run_dir, force_load=True) as job:
+            properties = properties.copy()
+            for name in missing_property_names:
+                properties[name] = getattr(job, name)
+        # opening the job options file may update its modification time
+        file_state = _job_options_file_state(run_dir)
+        with _cached_job_properties_lock:
+            _cached_job_properties[key] = (file_state, properties)
+
+    return tuple(properties[name] for name in property_names)
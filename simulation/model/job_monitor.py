@@ -0,0 +1,180 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+import threading
+import time
+
+import simulation.model.constants
+import simulation.model.job
+
+import util.logging
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class Job_Monitor():
+    # Watches many Metos3D jobs at once in one asyncio event loop running in a background thread.
+    # Each job is polled with an adaptive pause. If inotify is available, the pause is interrupted as soon as the finished file or the output file is written.
+    # Blocking job checks are executed in a thread pool so that the event loop is never blocked.
+
+    def __init__(self, use_inotify=None, pause_seconds_min=None, pause_seconds_max=None, pause_seconds_factor=None, full_check_seconds=None, max_workers=None):
+        if use_inotify is None:
+            use_inotify = simulation.model.constants.JOB_MONITOR_USE_INOTIFY
+        if pause_seconds_min is None:
+            pause_seconds_min = simulation.model.constants.JOB_MONITOR_PAUSE_SECONDS_MIN
+        if pause_seconds_max is None:
+            pause_seconds_max = simulation.model.constants.JOB_MONITOR_PAUSE_SECONDS_MAX
+        if pause_seconds_factor is None:
+            pause_seconds_factor = simulation.model.constants.JOB_MONITOR_PAUSE_SECONDS_FACTOR
+        if full_check_seconds is None:
+            full_check_seconds = simulation.model.constants.JOB_MONITOR_FULL_CHECK_SECONDS
+        if max_workers is None:
+            max_workers = simulation.model.constants.JOB_MONITOR_MAX_WORKERS
+
+        self.use_inotify = use_inotify and inotify_simple is not None
+        if use_inotify and not self.use_inotify:
+            util.logging.debug('The inotify_simple package is not available. Job monitor uses only polling.')
+        self.pause_seconds_min = pause_seconds_min
+        self.pause_seconds_max = pause_seconds_max
+        self.pause_seconds_factor = pause_seconds_factor
+        self.full_check_seconds = full_check_seconds
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._inotify = None
+        self._inotify_watches = {}
+
+    # event loop
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_event_loop, args=(loop,), name='job_monitor', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _run_event_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        if self.use_inotify:
+            self._inotify = inotify_simple.INotify()
+            loop.add_reader(self._inotify.fileno(), self._read_inotify_events)
+        loop.run_forever()
+
+    # inotify
+
+    def _add_inotify_watch(self, directory, filenames, wake_event):
+        if self._inotify is None:
+            return None
+        mask = inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO | inotify_simple.flags.CREATE
+        try:
+            watch_descriptor = self._inotify.add_watch(directory, mask)
+        except OSError as e:
+            util.logging.debug(f'Directory {directory} could not be watched with inotify: {e}')
+            return None
+        self._inotify_watches.setdefault(watch_descriptor, []).append((filenames, wake_event))
+        return watch_descriptor
+
+    def _remove_inotify_watch(self, watch_descriptor, wake_event):
+        if watch_descriptor is None:
+            return
+        watches = self._inotify_watches.get(watch_descriptor, [])
+        watches[:] = [(filenames, event) for (filenames, event) in watches if event is not wake_event]
+        if len(watches) == 0:
+            self._inotify_watches.pop(watch_descriptor, None)
+            try:
+                self._inotify.rm_watch(watch_descriptor)
+            except OSError:
+                pass
+
+    def _read_inotify_events(self):
+        for inotify_event in self._inotify.read(timeout=0):
+            for filenames, wake_event in self._inotify_watches.get(inotify_event.wd, ()):
+                if inotify_event.name in filenames:
+                    wake_event.set()
+
+    # waiting
+
+    def _run_blocking(self, function, *args, **kargs):
+        return self._loop.run_in_executor(self._executor, functools.partial(function, *args, **kargs))
+
+    async def _wait_until_finished(self, run_dir, callback=None):
+        job = await self._run_blocking(simulation.model.job.Metos3D_Job, run_dir, force_load=True)
+        wake_event = asyncio.Event()
+        watch_descriptor = None
+        try:
+            finished_file = await self._run_blocking(lambda: job.finished_file)
+            output_file = await self._run_blocking(lambda: job.output_file)
+            watch_descriptor = self._add_inotify_watch(os.path.dirname(finished_file), {os.path.basename(finished_file), os.path.basename(output_file)}, wake_event)
+            util.logging.debug(f'Job monitor is watching job in {run_dir}.')
+
+            # poll cheaply if the finished file exists, check the job completely only after this or after a longer period to detect failed jobs
+            pause_seconds = self.pause_seconds_min
+            last_full_check_time = time.monotonic()
+            while True:
+                wake_event.clear()
+                now = time.monotonic()
+                finished_file_exists = await self._run_blocking(os.path.exists, finished_file)
+                if finished_file_exists or now - last_full_check_time >= self.full_check_seconds:
+                    last_full_check_time = now
+                    if await self._run_blocking(job.is_finished, check_exit_code=True):
+                        break
+                    if finished_file_exists:
+                        pause_seconds = self.pause_seconds_min
+
+                try:
+                    await asyncio.wait_for(wake_event.wait(), pause_seconds)
+                except asyncio.TimeoutError:
+                    pause_seconds = min(pause_seconds * self.pause_seconds_factor, self.pause_seconds_max)
+                else:
+                    pause_seconds = self.pause_seconds_min
+                    await asyncio.sleep(self.pause_seconds_min)
+            util.logging.debug(f'Job monitor detected that job in {run_dir} is finished.')
+
+            # call callback
+            if callback is not None:
+                return await self._run_blocking(callback, job)
+            else:
+                return run_dir
+
+        finally:
+            self._remove_inotify_watch(watch_descriptor, wake_event)
+            await self._run_blocking(job.close)
+
+    # public interface
+
+    def watch(self, run_dir, callback=None):
+        # returns a concurrent.futures.Future which is done if the job in run_dir is finished
+        # if callback is passed, it is called with the open job and its result is the result of the future, otherwise the result is run_dir
+        # use asyncio.wrap_future to await it in an event loop
+        loop = self._event_loop()
+        return asyncio.run_coroutine_threadsafe(self._wait_until_finished(run_dir, callback=callback), loop)
+
+    def as_completed(self, run_dirs, callback=None):
+        # yields (run_dir, result) in order of completion
+        futures = {self.watch(run_dir, callback=callback): run_dir for run_dir in run_dirs}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+    def wait(self, run_dirs, callback=None):
+        # returns results in order of run_dirs
+        futures = [self.watch(run_dir, callback=callback) for run_dir in run_dirs]
+        return [future.result() for future in futures]
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def monitor():
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = Job_Monitor()
+        return _monitor
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+
+import simulation.model.constants
+
+import util.io.filelock.unix
+
+
+class _Locked_JSON_File(util.io.filelock.unix.LockedFile):
+
+    def _load(self, file):
+        with open(file, 'r') as f:
+            return json.load(f)
+
+    def _save(self, file, value):
+        tmp_file = f'{file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(value, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, file)
+
+
+class Spinup_Summary():
+    # Summary of the finished runs of one spinup dir stored as JSON file in the spinup dir.
+    # Each run entry contains its years, the total years of the chain up to this run, its last tolerance and its output files.
+    # An entry is only valid as long as the job output file of its run has the recorded size and modification time.
+
+    def __init__(self, spinup_dir):
+        # spinup dirs of tracer input files may contain environment variables
+        self.spinup_dir = os.path.normpath(os.path.expandvars(spinup_dir))
+        self.file = os.path.join(self.spinup_dir, simulation.model.constants.DATABASE_SPINUP_SUMMARY_FILENAME)
+        self._locked_file, self._lock = _locked_file(self.file)
+
+    @staticmethod
+    def _file_state(file):
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            return None
+        else:
+            return [stat.st_size, stat.st_mtime_ns]
+
+    def _summary(self):
+        try:
+            return self._locked_file.load()
+        except FileNotFoundError:
+            return {'runs': {}}
+
+    def run(self, run_dirname):
+        with self._lock:
+            entry = self._summary()['runs'].get(run_dirname)
+        if entry is None:
+            return None
+
+        run_dir = os.path.join(self.spinup_dir, run_dirname)
+        output_file = os.path.join(run_dir, entry['output_file'])
+        if self._file_state(output_file) != entry['output_file_state']:
+            return None
+
+        entry = entry.copy()
+        entry['output_file'] = output_file
+        entry['tracer_output_files'] = [os.path.join(run_dir, file) for file in entry['tracer_output_files']]
+        return entry
+
+    def add_run(self, run_dirname, years, tolerance, output_file, tracer_output_files, previous_total_years=0):
+        run_dir = os.path.abspath(os.path.join(self.spinup_dir, run_dirname))
+        output_file = os.path.abspath(os.path.expandvars(output_file))
+        tracer_output_files = [os.path.abspath(os.path.expandvars(file)) for file in tracer_output_files]
+        entry = {'years': int(years),
+                 'total_years': int(previous_total_years + years),
+                 'tolerance': float(tolerance),
+                 'output_file': os.path.relpath(output_file, run_dir),
+                 'output_file_state': self._file_state(output_file),
+                 'tracer_output_files': [os.path.relpath(file, run_dir) for file in tracer_output_files]}
+        with self._lock:
+            with self._locked_file.lock_object(exclusive=True):
+                summary = self._summary()
+                summary['runs'][run_dirname] = entry
+                self._locked_file.save(summary)
+        return self.run(run_dirname)
+
+
+_locked_files = {}
+_locked_files_lock = threading.Lock()
+
+
+def _locked_file(file):
+    # one locked file per process and file, so that its loaded value is reused until the file is modified
+    with _locked_files_lock:
+        try:
+            return _locked_files[file]
+        except KeyError:
+            locked_file = (_Locked_JSON_File(file), threading.RLock())
+            _locked_files[file] = locked_file
+            return locked_file
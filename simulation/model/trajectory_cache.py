@@ -0,0 +1,140 @@
+import contextlib
+import hashlib
+import os
+import tempfile
+import warnings
+
+import util.io.filelock.unix
+import util.io.fs
+import util.logging
+
+
+class _Lock_File(util.io.filelock.unix.LockedFile):
+    # only used for locking, no values are stored
+    pass
+
+
+class Trajectory_Cache:
+
+    def __init__(self, cache_dir, max_size_gb):
+        # trajectories are stored in one directory per key, least recently used directories are removed if max size is exceeded
+        self.cache_dir = cache_dir
+        self.max_size_gb = max_size_gb
+
+    # *** keys and dirs *** #
+
+    @staticmethod
+    def key(run_dir, model_parameters, run_tracer_output_files, *key_values):
+        # key includes modification times of run output so that recalculated runs are not mixed up
+        key = hashlib.sha256()
+        key.update(repr((os.path.realpath(run_dir), tuple(model_parameters))).encode())
+        for file in run_tracer_output_files:
+            file = os.path.expandvars(file)
+            stat = os.stat(file)
+            key.update(repr((file, stat.st_mtime_ns, stat.st_size)).encode())
+        key.update(repr(key_values).encode())
+        return key.hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _lock_file(self, key):
+        return os.path.join(self.cache_dir, f'.{key}.lock')
+
+    def lock(self, key, exclusive=False):
+        # shared lock while an entry is used, exclusive lock while it is removed
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return _Lock_File(self._lock_file(key)).lock_object(exclusive=exclusive)
+
+    def entries(self):
+        try:
+            with os.scandir(self.cache_dir) as dir_entries:
+                return [dir_entry.path for dir_entry in dir_entries if dir_entry.is_dir(follow_symlinks=False) and not dir_entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    # *** get *** #
+
+    @contextlib.contextmanager
+    def use(self, key, create_function):
+        # yields dir of existing entry or creates entry by calling create_function with a new dir,
+        # entry is not removed by other processes until the context is left
+        with self.lock(key, exclusive=False):
+            entry_dir, created = self._get(key, create_function)
+            yield entry_dir
+        # evict after lock is released so that no two locks are held at the same time
+        if created:
+            self.evict(keep=(entry_dir,))
+
+    def _get(self, key, create_function):
+        entry_dir = self.entry_dir(key)
+
+        created = not os.path.exists(entry_dir)
+        if not created:
+            util.logging.debug(f'Using cached trajectory in {entry_dir}.')
+        else:
+            # create in temporary dir and move afterwards
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+            try:
+                create_function(tmp_dir)
+                try:
+                    os.rename(tmp_dir, entry_dir)
+                except OSError:
+                    # entry created concurrently by another process
+                    if not os.path.exists(entry_dir):
+                        raise
+                    util.logging.debug(f'Trajectory for {entry_dir} was created concurrently.')
+                else:
+                    util.logging.debug(f'Trajectory cached in {entry_dir}.')
+            finally:
+                if os.path.exists(tmp_dir):
+                    util.io.fs.remove_recursively(tmp_dir, force=True, not_exist_okay=True, exclude_dir=False)
+
+        # mark as recently used
+        os.utime(entry_dir)
+        return entry_dir, created
+
+    # *** eviction *** #
+
+    @staticmethod
+    def _size(dir):
+        size = 0
+        for dirpath, dirnames, filenames in os.walk(dir):
+            for filename in filenames:
+                try:
+                    size += os.lstat(os.path.join(dirpath, filename)).st_size
+                except FileNotFoundError:
+                    pass
+        return size
+
+    def evict(self, keep=()):
+        max_size = self.max_size_gb * 1024**3
+        entries = []
+        for entry_dir in self.entries():
+            try:
+                entries.append((os.stat(entry_dir).st_mtime, self._size(entry_dir), entry_dir))
+            except FileNotFoundError:
+                pass
+        size = sum(entry_size for entry_mtime, entry_size, entry_dir in entries)
+
+        # remove least recently used entries
+        for entry_mtime, entry_size, entry_dir in sorted(entries):
+            if size <= max_size:
+                break
+            if entry_dir not in keep:
+                # wait until entry is not used anymore
+                with self.lock(os.path.basename(entry_dir), exclusive=True):
+                    if not os.path.exists(entry_dir):
+                        size -= entry_size
+                        continue
+                    util.logging.debug(f'Removing cached trajectory {entry_dir} with size {entry_size} bytes.')
+                    # rename first so that entry is not used while it is removed
+                    removed_dir = os.path.join(self.cache_dir, '.removed_' + os.path.basename(entry_dir))
+                    try:
+                        os.rename(entry_dir, removed_dir)
+                        util.io.fs.remove_recursively(removed_dir, force=True, not_exist_okay=True, exclude_dir=False)
+                    except OSError as e:
+                        warnings.warn(f'Cached trajectory {entry_dir} could not be removed: {e}')
+                    else:
+                        size -= entry_size
@@ -156,7 +156,10 @@ class OLS(Base):
     def df_calculate_unnormalized(self, derivative_order=1, accuracy_order=None):
         if derivative_order in (1, 2):
             F = self.model_f()
-            DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            if derivative_order == 1:
+                DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            else:
+                DF, D2F = self.model_df_for_orders((1, 2), accuracy_order=accuracy_order)
             results = self.measurements_results()
             residuals = F - results
 
@@ -166,7 +169,6 @@ class OLS(Base):
                 assert df.shape == (self.model_parameters_len,)
                 return df
             else:
-                D2F = self.model_df(derivative_order=2, accuracy_order=accuracy_order)
                 d2f = 2 * (DF.T @ DF + np.sum(residuals[:, np.newaxis, np.newaxis] * D2F, axis=0))
                 assert np.all(np.isfinite(d2f))
                 assert d2f.shape == (self.model_parameters_len, self.model_parameters_len)
@@ -189,7 +191,10 @@ class WLS(BaseUsingStandardDeviation):
     def df_calculate_unnormalized(self, derivative_order=1, accuracy_order=None):
         if derivative_order in (1, 2):
             F = self.model_f()
-            DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            if derivative_order == 1:
+                DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            else:
+                DF, D2F = self.model_df_for_orders((1, 2), accuracy_order=accuracy_order)
             results = self.measurements_results()
             variances = self.measurements.variances
             weighted_residuals = (F - results) / variances
@@ -200,7 +205,6 @@ class WLS(BaseUsingStandardDeviation):
                 assert df.shape == (self.model_parameters_len,)
                 return df
             else:
-                D2F = self.model_df(derivative_order=2, accuracy_order=accuracy_order)
                 DF_weighted = DF / standard_deviations[:, np.newaxis]
                 d2f = 2 * (DF_weighted.T @ DF_weighted + np.inner(D2F, weighted_residuals))
                 assert np.all(np.isfinite(d2f))
@@ -225,7 +229,10 @@ class GLS(BaseUsingCorrelation):
     def df_calculate_unnormalized(self, derivative_order=1, accuracy_order=None):
         if derivative_order in (1, 2):
             F = self.model_f()
-            DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            if derivative_order == 1:
+                DF = self.model_df(derivative_order=1, accuracy_order=accuracy_order)
+            else:
+                DF, D2F = self.model_df_for_orders((1, 2), accuracy_order=accuracy_order)
             results = self.measurements_results()
             standard_deviations = self.measurements.standard_deviations
             weighted_residuals = (F - results) / standard_deviations
@@ -239,7 +246,6 @@ class GLS(BaseUsingCorrelation):
                 assert df.shape == (self.model_parameters_len,)
                 return df
             else:
-                D2F = self.model_df(derivative_order=2, accuracy_order=accuracy_order)
                 DF_weighted = DF / standard_deviations[:, np.newaxis]
                 d2f = 2 * (correlation_matrix_decomposition.inverse_matrix_both_sides_multiplication(DF_weighted) + np.tensordot(D2F, factors, axes=(0, 0)))
                 assert np.all(np.isfinite(d2f))
@@ -272,6 +278,13 @@ class BaseLog(Base):
         df[min_mask] = 0
         return df
 
+    def model_df_for_orders(self, derivative_orders, accuracy_order=None):
+        min_mask = super().model_f() < self.min_value
+        dfs = super().model_df_for_orders(derivative_orders, accuracy_order=accuracy_order)
+        for df in dfs:
+            df[min_mask] = 0
+        return dfs
+
     def measurements_results(self):
         return np.maximum(super().measurements_results(), self.min_value)
 
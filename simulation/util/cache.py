@@ -177,6 +177,17 @@ class Cache():
         assert df.shape == (self.measurements.number_of_measurements,) + (self.model_parameters_len,) * derivative_order
         return df
 
+    def model_df_for_orders(self, derivative_orders, accuracy_order=None):
+        # shared partial derivative runs of all derivative orders are only started once
+        orders = [(derivative_order, accuracy_order) for derivative_order in derivative_orders]
+        df_dict = self.model.df_measurements_for_orders(*self.measurements, orders=orders, include_total_concentration=self.include_initial_concentrations_factor_to_model_parameters)
+        dfs = []
+        for derivative_order, df in zip(derivative_orders, df_dict.values()):
+            df = self.measurements.convert_measurements_dict_to_array(df)
+            assert df.shape == (self.measurements.number_of_measurements,) + (self.model_parameters_len,) * derivative_order
+            dfs.append(df)
+        return tuple(dfs)
+
     def model_df_all_boxes(self, time_dim, derivative_order=1, accuracy_order=None, as_shared_array=False):
         df = self.model.df_all(time_dim, include_total_concentration=self.include_initial_concentrations_factor_to_model_parameters, derivative_order=derivative_order, accuracy_order=accuracy_order, return_as_dict=False)
         assert df.shape[1] == time_dim and df.shape[-1] == self.model_parameters_len